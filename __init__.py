@@ -2,6 +2,10 @@ from .vanwarrington import *
 from .apparentimpedance import *
 from .capbank import *
 from .diffcharacteristic import *
+from .faultstudy import *
+from .arcflash import *
+from .montecarlo import *
+from .comtrade import *
 
 __version__ = '0.1'
 
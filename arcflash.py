@@ -0,0 +1,173 @@
+import numpy as np
+
+try:
+	from .vanwarrington import vanwarrington
+except ImportError:
+	from vanwarrington import vanwarrington
+
+
+# distance exponents from IEEE 1584-2002 Table 4, [up to 1kV, above 1kV]
+_distancex = {
+	'open': [2.000, 2.000],
+	'switchgear': [1.473, 0.973],
+	'mcc': [1.641, 0.973],
+	'panel': [1.641, 0.973],
+	'cable': [2.000, 2.000]
+	}
+
+
+def arcingcurrent(kV, Ibf, gap, enclosed=True):
+	"""Calculates the arcing current in kA using the IEEE 1584-2002 empirical
+	model, all inputs can be arrays.
+		Inputs:
+				kV = system voltage in kV
+				Ibf = bolted three phase fault current in kA
+				gap = gap between conductors in mm
+				enclosed = True for arcs in a box, False for arcs in open air
+	"""
+	kV, Ibf, gap, enclosed = np.broadcast_arrays(
+		np.asarray(kV, dtype=float), np.asarray(Ibf, dtype=float),
+		np.asarray(gap, dtype=float), np.asarray(enclosed, dtype=bool)
+		)
+	lgIbf = np.log10(Ibf)
+	K = np.where(enclosed, -0.097, -0.153)
+	low = (
+		K + 0.662 * lgIbf + 0.0966 * kV + 0.000526 * gap +
+		0.5588 * kV * lgIbf - 0.00304 * gap * lgIbf
+		)
+	high = 0.00402 + 0.983 * lgIbf
+	return (10**np.where(kV < 1, low, high))[()]
+
+
+def incidentenergy(kV, Ibf, Iarc, gap, distance, time, equipment='switchgear',
+		enclosed=True, grounded=True):
+	"""Calculates the incident energy in J/cm2 and the arc flash boundary in mm
+	using the IEEE 1584-2002 model up to 15kV and the Lee method above 15kV, all
+	inputs can be arrays.
+		Inputs:
+				kV = system voltage in kV
+				Ibf = bolted three phase fault current in kA
+				Iarc = arcing current in kA
+				gap = gap between conductors in mm
+				distance = working distance in mm
+				time = arc duration in seconds
+				equipment = open, switchgear, mcc, panel or cable
+				enclosed = True for arcs in a box, False for arcs in open air
+				grounded = True for solidly grounded systems
+		Output is a dictionary that contains the Energy and the Boundary
+	"""
+	kV, Ibf, Iarc, gap, distance, time, equipment, enclosed, grounded = (
+		np.broadcast_arrays(
+			np.asarray(kV, dtype=float), np.asarray(Ibf, dtype=float),
+			np.asarray(Iarc, dtype=float), np.asarray(gap, dtype=float),
+			np.asarray(distance, dtype=float), np.asarray(time, dtype=float),
+			np.asarray(equipment), np.asarray(enclosed, dtype=bool),
+			np.asarray(grounded, dtype=bool)
+			)
+		)
+	x = np.ones(kV.shape)
+	for name, factors in _distancex.items():
+		x = np.where(equipment == name, np.where(kV <= 1, *factors), x)
+
+	K1 = np.where(enclosed, -0.555, -0.792)
+	K2 = np.where(grounded, -0.113, 0)
+	En = 10**(K1 + K2 + 1.081 * np.log10(Iarc) + 0.0011 * gap)
+	Cf = np.where(kV <= 1, 1.5, 1.0)
+	scale = 4.184 * Cf * En * (time / 0.2) * 610**x
+	energy = scale / distance**x
+	boundary = (scale / 5.0)**(1 / x)
+
+	lee = 2.142e6 * kV * Ibf * time
+	energy = np.where(kV > 15, lee / distance**2, energy)
+	boundary = np.where(kV > 15, np.sqrt(lee / 5.0), boundary)
+	return {'Energy': energy[()], 'Boundary': boundary[()]}
+
+
+def arcflash(relays, relay, kV, Ibf, gap, distance, equipment='switchgear',
+		enclosed=None, grounded=True, share=1, breaker=0.05, maxtime=2,
+		buses=None):
+	"""Calculates the arc flash incident energy for a group of buses using the
+	clearing time of the upstream overcurrent relay of each bus. For systems up to
+	1kV the energy is also calculated at 85% of the arcing current and the higher
+	energy is reported as required by IEEE 1584. Above 15kV the arcing current
+	seen by the relay is reduced by the Van Warrington arc resistance, assuming a
+	reactive source impedance, and the Lee method is used for the energy.
+		Inputs:
+				relays = list of overcurrent.Relay objects
+				relay = the index into relays of the upstream relay for each bus
+				kV = system voltage in kV
+				Ibf = bolted three phase fault current in kA
+				gap = gap between conductors in mm, also used as the arc length for the
+					Van Warrington resistance
+				distance = working distance in mm
+				equipment = open, switchgear, mcc, panel or cable
+				enclosed = True for arcs in a box, by default all equipment other than
+					open is enclosed
+				grounded = True for solidly grounded systems
+				share = the fraction of the arcing current seen by the relay
+				breaker = breaker opening time in seconds
+				maxtime = the longest arc duration, 2 seconds is commonly used
+				buses = list of bus names, by default the bus number is used
+		Output is a structured array with a record for each bus containing the bus
+		name, voltage, bolted and arcing current in kA, arc duration, incident energy
+		in J/cm2 and cal/cm2 and the arc flash boundary in mm. Use np.sort with
+		order='Energy' to rank the buses.
+	"""
+	if enclosed is None:
+		enclosed = np.asarray(equipment) != 'open'
+	relay, kV, Ibf, gap, distance, equipment, enclosed, grounded, share, \
+		breaker = np.broadcast_arrays(
+			np.asarray(relay), np.asarray(kV, dtype=float),
+			np.asarray(Ibf, dtype=float), np.asarray(gap, dtype=float),
+			np.asarray(distance, dtype=float), np.asarray(equipment),
+			np.asarray(enclosed, dtype=bool), np.asarray(grounded, dtype=bool),
+			np.asarray(share, dtype=float), np.asarray(breaker, dtype=float)
+			)
+
+	Iarc = np.array(arcingcurrent(kV, Ibf, gap, enclosed))
+	hv = kV > 15
+	if hv.any():
+		Vph = 1000 * kV[hv] / np.sqrt(3)
+		X = Vph / (1000 * Ibf[hv])
+		Ia = 1000 * Ibf[hv]
+		# the resistance is not rounded, 0.01 ohm is larger than the arc resistance
+		# at these fault levels
+		for n in range(20):
+			R = vanwarrington(Ia, gap[hv] / 1000, decimals=None)
+			Ia = Vph / np.hypot(X, R)
+		Iarc[hv] = Ia / 1000
+
+	results = []
+	for factor in [1.0, 0.85]:
+		Ia = Iarc * np.where(kV <= 1, factor, 1)
+		seen = 1000 * Ia * share
+		time = np.empty(kV.shape)
+		for r in np.unique(relay):
+			buses_r = relay == r
+			time[buses_r] = relays[r].getoptime(seen[buses_r])
+		time = np.minimum(time + breaker, maxtime)
+		energy = incidentenergy(
+			kV, Ibf, Ia, gap, distance, time, equipment, enclosed, grounded
+			)
+		results.append((Ia, time, energy['Energy'], energy['Boundary']))
+	worst = results[1][2] > results[0][2]
+
+	if buses is None:
+		buses = [str(bus + 1) for bus in range(kV.size)]
+	table = np.zeros(kV.size, dtype=[
+		('Bus', 'U32'),
+		('kV', float),
+		('Ibf', float),
+		('Iarc', float),
+		('Time', float),
+		('Energy', float),
+		('EnergyCal', float),
+		('Boundary', float)
+		])
+	table['Bus'] = np.asarray(buses).ravel()
+	table['kV'] = kV.ravel()
+	table['Ibf'] = Ibf.ravel()
+	for k, field in enumerate(['Iarc', 'Time', 'Energy', 'Boundary']):
+		table[field] = np.where(worst, results[1][k], results[0][k]).ravel()
+	table['EnergyCal'] = table['Energy'] / 4.184
+	return table
@@ -0,0 +1,275 @@
+import io
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+class Comtrade:
+	"""A COMTRADE record (1991, 1999 or 2013 format) read from its cfg and dat
+	files. The cfg file is parsed when the record is opened, the dat file is
+	memory mapped and read a chunk at a time so the whole record is never held in
+	memory. ASCII, BINARY, BINARY32 and FLOAT32 dat files are supported.
+	"""
+
+	def __init__(self, cfgfile, datfile=None):
+		self.cfgfile = cfgfile
+		self.datfile = datfile or os.path.splitext(cfgfile)[0] + '.dat'
+		with open(cfgfile, encoding='latin-1') as f:
+			lines = [line.strip() for line in f if line.strip()]
+		fields = [[field.strip() for field in line.split(',')] for line in lines]
+
+		self.station = fields[0][0]
+		self.recorder = fields[0][1] if len(fields[0]) > 1 else ''
+		self.year = int(fields[0][2]) if len(fields[0]) > 2 else 1991
+		counts = fields[1]
+		A = int(counts[1].rstrip('Aa'))
+		D = int(counts[2].rstrip('Dd'))
+		self.analog = []
+		for row in fields[2:2 + A]:
+			self.analog.append({
+				'name': row[1],
+				'phase': row[2],
+				'units': row[4],
+				'a': float(row[5]),
+				'b': float(row[6]),
+				'primary': float(row[10]) if len(row) > 12 else 1.0,
+				'secondary': float(row[11]) if len(row) > 12 else 1.0,
+				'ps': row[12].upper() if len(row) > 12 else 'P'
+				})
+		self.digital = [row[1] for row in fields[2 + A:2 + A + D]]
+		line = 2 + A + D
+		self.frequency = float(fields[line][0])
+		nrates = int(fields[line + 1][0])
+		self.rates = [
+			(float(row[0]), int(row[1]))
+			for row in fields[line + 2:line + 2 + max(nrates, 1)]
+			]
+		line += 2 + max(nrates, 1)
+		self.start = ','.join(fields[line])
+		self.trigger = ','.join(fields[line + 1])
+		self.filetype = fields[line + 2][0].upper()
+		self.timemult = (
+			float(fields[line + 3][0]) if len(fields) > line + 3 else 1.0
+			)
+		if self.filetype not in ('ASCII', 'BINARY', 'BINARY32', 'FLOAT32'):
+			raise ValueError('unknown dat file type ' + self.filetype)
+		if nrates > 1:
+			raise ValueError(
+				'records with more than one sample rate are not supported'
+				)
+		self.rate = self.rates[0][0]
+		self.samples = self.rates[0][1]
+
+	def channel(self, name):
+		"""returns the index of an analog channel given its name or index"""
+		if isinstance(name, (int, np.integer)):
+			return int(name)
+		for k, channel in enumerate(self.analog):
+			if channel['name'] == name:
+				return k
+		raise ValueError('no analog channel named ' + str(name))
+
+	def chunks(self, channels, chunksize=65536, primary=True):
+		"""Reads the record a chunk of samples at a time.
+			Inputs:
+					channels = list of analog channel names or indices
+					chunksize = number of samples in each chunk
+					primary = True for primary values, False for secondary values
+			Yields the sample times in seconds and a samples x channels array of the
+			scaled channel values for each chunk
+		"""
+		index = [self.channel(name) for name in channels]
+		scale = np.array([self._scale(k, primary) for k in index])
+		a = np.array([self.analog[k]['a'] for k in index]) * scale
+		b = np.array([self.analog[k]['b'] for k in index]) * scale
+		if self.filetype == 'ASCII':
+			reader = self._asciichunks(index, chunksize)
+		else:
+			reader = self._binarychunks(index, chunksize)
+		for number, timestamp, raw in reader:
+			if self.rate > 0:
+				time = (number - 1) / self.rate
+			else:
+				time = timestamp * self.timemult * 1e-6
+			yield time, raw * a + b
+
+	def _scale(self, k, primary):
+		"""returns the factor from the recorded to the primary or secondary value"""
+		channel = self.analog[k]
+		if primary and channel['ps'] == 'S':
+			return channel['primary'] / channel['secondary']
+		if not primary and channel['ps'] == 'P':
+			return channel['secondary'] / channel['primary']
+		return 1.0
+
+	def _binarychunks(self, index, chunksize):
+		"""yields sample numbers, timestamps and raw values from a binary dat file,
+		missing samples are nan"""
+		analogtype = {'BINARY': '<i2', 'BINARY32': '<i4', 'FLOAT32': '<f4'}
+		# missing samples are marked 0x8000 or 0x80000000 and read as nan
+		missing = {'BINARY': -0x8000, 'BINARY32': -0x80000000}.get(self.filetype)
+		dtype = [
+			('n', '<u4'), ('t', '<u4'),
+			('a', analogtype[self.filetype], (len(self.analog),)),
+			('d', '<u2', (-(-len(self.digital) // 16),))
+			]
+		count = os.path.getsize(self.datfile) // np.dtype(dtype).itemsize
+		if count == 0:
+			return
+		data = np.memmap(self.datfile, dtype=dtype, mode='r', shape=(count,))
+		for start in range(0, count, chunksize):
+			chunk = data[start:start + chunksize]
+			raw = chunk['a'][:, index].astype(float)
+			if missing is not None:
+				raw[chunk['a'][:, index] == missing] = np.nan
+			yield chunk['n'].astype(float), chunk['t'].astype(float), raw
+
+	def _asciichunks(self, index, chunksize):
+		"""yields sample numbers, timestamps and raw values from an ascii dat file,
+		each chunk is cut from the memory mapped file at a line end. Blank fields,
+		a timestamp left out where the sample rate is given or a missing sample,
+		are read as nan"""
+		if os.path.getsize(self.datfile) == 0:
+			return
+		columns = [0, 1] + [2 + k for k in index]
+		with open(self.datfile, 'rb') as f:
+			with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+				position = 0
+				while position < len(data):
+					end = position
+					for n in range(chunksize):
+						end = data.find(b'\n', end) + 1
+						if end == 0:
+							end = len(data)
+							break
+					values = np.genfromtxt(
+						io.BytesIO(data[position:end]), delimiter=',', usecols=columns,
+						filling_values=np.nan, ndmin=2
+						)
+					position = end
+					if values.size:
+						yield values[:, 0], values[:, 1], values[:, 2:]
+
+
+class SlidingDFT:
+	"""A full cycle sliding DFT that estimates the fundamental phasors of a set of
+	channels. Samples are passed in chunks, the last cycle of each chunk is
+	carried to the next so the phasors are the same as a sample by sample
+	calculation. The phasors are RMS values on a fixed reference, nan until the
+	first full cycle has been seen.
+	"""
+
+	def __init__(self, N, channels=1):
+		self.N = int(N)
+		self.index = 0
+		self.carry = np.zeros((0, channels), dtype=complex)
+		self.carrymissing = np.zeros((0, channels), dtype=int)
+
+	def update(self, x):
+		"""returns the phasors at each sample of the chunk x, samples x channels.
+		Missing samples (nan) give nan phasors for the cycle that contains them."""
+		x = np.asarray(x, dtype=float)
+		missing = np.isnan(x)
+		n = np.arange(self.index, self.index + len(x))
+		rotated = np.where(missing, 0, x) * np.exp(
+			-2j * np.pi * (n % self.N) / self.N
+			)[:, None]
+		full = np.concatenate((self.carry, rotated))
+		fullmissing = np.concatenate((self.carrymissing, missing.astype(int)))
+		total = np.concatenate(
+			(np.zeros((1, x.shape[1]), dtype=complex), np.cumsum(full, axis=0))
+			)
+		gaps = np.concatenate(
+			(np.zeros((1, x.shape[1]), dtype=int), np.cumsum(fullmissing, axis=0))
+			)
+		end = np.arange(len(self.carry), len(full)) + 1
+		begin = end - self.N
+		start = np.maximum(begin, 0)
+		phasor = (total[end] - total[start]) * np.sqrt(2) / self.N
+		phasor[begin < 0] = np.nan
+		phasor[gaps[end] - gaps[start] > 0] = np.nan
+		keep = slice(-(self.N - 1), None) if self.N > 1 else slice(0, 0)
+		self.carry = full[keep]
+		self.carrymissing = fullmissing[keep]
+		self.index += len(x)
+		return phasor
+
+
+def replay(cfgfile, device, local, remote, base=1, chunksize=65536,
+		primary=True):
+	"""Replays a COMTRADE record through a differential characteristic. The local
+	and remote currents are converted to fundamental phasors with a full cycle
+	sliding DFT and the trip mask of the device is evaluated at every sample,
+	the record is read a chunk at a time.
+		Inputs:
+				cfgfile = the cfg file of the record, the dat file has the same name
+				device = a differential characteristic, for example P543()
+				local = list of the local current channel names or indices, one for
+					each phase
+				remote = list of the remote current channel names or indices
+				base = the base current used to convert the currents to per unit,
+					either a scalar or [local base, remote base]
+				chunksize = number of samples read at a time
+				primary = True to use primary values, False for secondary values
+		Output is a dictionary that contains the sample Time, the samples x phases
+		Trip timeline (False for the cycle after a missing sample), the First trip
+		time of each phase (nan where the phase does not trip) and the record name
+	"""
+	record = Comtrade(cfgfile)
+	N = round(record.rate / record.frequency)
+	if N < 2:
+		raise ValueError('the sample rate of the record is too low')
+	phases = len(local)
+	if len(remote) != phases:
+		raise ValueError('local and remote must have the same number of channels')
+	localbase, remotebase = np.broadcast_to(np.asarray(base, dtype=float), (2,))
+	dft = SlidingDFT(N, 2 * phases)
+	times = []
+	trips = []
+	for time, values in record.chunks(
+			list(local) + list(remote), chunksize, primary
+			):
+		phasor = dft.update(values)
+		Iloc = phasor[:, :phases] / localbase
+		Irem = phasor[:, phases:] / remotebase
+		with np.errstate(invalid='ignore'):
+			trip = device.tripmask(Iloc, Irem)[0]
+		times.append(time)
+		trips.append(trip & ~np.isnan(Iloc) & ~np.isnan(Irem))
+	time = np.concatenate(times) if times else np.zeros(0)
+	trip = np.concatenate(trips) if trips else np.zeros((0, phases), dtype=bool)
+	first = np.full(phases, np.nan)
+	tripped = trip.any(axis=0)
+	first[tripped] = time[np.argmax(trip, axis=0)[tripped]]
+	return {
+		'Record': os.path.basename(cfgfile),
+		'Time': time,
+		'Trip': trip,
+		'First': first
+		}
+
+
+def replayfiles(cfgfiles, device, local, remote, base=1, chunksize=65536,
+		primary=True, processes=None):
+	"""Replays a list of COMTRADE records through a differential characteristic
+	in parallel worker processes, see replay for the inputs.
+		Inputs:
+				processes = number of worker processes, None uses the number of CPUs and
+					1 replays the records in this process
+		Output is a list of the replay results in the order of the files
+	"""
+	jobs = [
+		(cfgfile, device, local, remote, base, chunksize, primary)
+		for cfgfile in cfgfiles
+		]
+	if processes == 1:
+		return [_replayjob(job) for job in jobs]
+	with ProcessPoolExecutor(max_workers=processes) as pool:
+		return list(pool.map(_replayjob, jobs))
+
+
+def _replayjob(job):
+	"""replays one record, this is called in the worker processes of replayfiles"""
+	return replay(*job)
@@ -1,146 +1,166 @@
 import matplotlib.pyplot as plt
 import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+
+class Boundary:
+	"""A differential characteristic compiled into a piecewise boundary in the
+	diff-restraint plane. Each segment is a row [rlo, a, b, c] that applies from
+	the restraint rlo up to the rlo of the next segment, the characteristic trips
+	where diff**power is above a + b * rest + c * rest**2 (or equal to it where the
+	boundary is inclusive). The boundary can be written to a dictionary with todict
+	and rebuilt with fromdict so compiled characteristics can be cached and sent
+	to worker processes.
+	"""
+	def __init__(self, segments, power=1, inclusive=False):
+		self.segments = np.array(segments, dtype=float).reshape(-1, 4)
+		self.segments = self.segments[np.argsort(self.segments[:, 0])]
+		self.power = power
+		self.inclusive = inclusive
+
+	def _coefficients(self, rest):
+		"""returns the a, b and c coefficients of the segment for each restraint"""
+		if len(self.segments) == 1:
+			return self.segments[0, 1:]
+		segment = np.searchsorted(self.segments[1:, 0], rest, side='right')
+		return [np.take(column, segment) for column in self.segments[:, 1:].T]
+
+	def threshold(self, rest):
+		"""returns the operating differential current for each restraint"""
+		rest = np.asarray(rest, dtype=float)
+		a, b, c = self._coefficients(rest)
+		return ((a + b * rest + c * rest**2) ** (1 / self.power))[()]
+
+	def severity(self, diff, rest):
+		"""returns diff**power less the boundary, positive where it trips"""
+		rest = np.asarray(rest, dtype=float)
+		a, b, c = self._coefficients(rest)
+		return (np.asarray(diff)**self.power - (a + b * rest + c * rest**2))[()]
+
+	def tripmask(self, diff, rest):
+		"""returns the boolean trip mask for arrays of diff and restraint"""
+		severity = self.severity(diff, rest)
+		if self.inclusive:
+			return severity >= 0
+		return severity > 0
+
+	def todict(self):
+		"""returns the boundary as a dictionary of plain lists and values"""
+		return {
+			'segments': self.segments.tolist(),
+			'power': self.power,
+			'inclusive': self.inclusive
+			}
 
+	@classmethod
+	def fromdict(cls, data):
+		"""rebuilds a boundary from the dictionary written by todict"""
+		return cls(data['segments'], data['power'], data['inclusive'])
 
-class L90_2Term:
-	"""This class is used to store a GE L90 Line Diff Setting and to call
-	functions to describe it
+
+class _Compiled:
+	"""The methods shared by the characteristics that compile into a Boundary,
+	each characteristic gives its own rest, restn and compile. The boundary is
+	built the first time it is used and dropped whenever a setting is changed,
+	so it is rebuilt on the next use.
 	"""
-	def __init__(self, S1=0.3, S2=0.5, BP=8, P=0.2, Sigma=0):
-		self.S1 = S1
-		self.S2 = S2
-		self.BP = BP
-		self.P = P
-		self.Sigma = Sigma
+	_boundary = None
 
-	def rest(self, Iloc, Irem):
-		"""The rest function calculates the restraint current for a line
-		differental application using the set characteristic along with the local
-		and remote currents. Once the line end currents are calculated, they are
-		combined and returned. Inputs:
-					Iloc = Local Current
-					Irem = Remote Current (this should be set negative to show outflow)
-		"""
-		if Iloc ** 2 < self.BP ** 2:
-			LocRestSq = (2 * self.S1 ** 2 * np.abs(Iloc) ** 2)
-		else:
-			LocRestSq = (
-										2 * ((self.S2 * Iloc)**2 - (self.S2 * self.BP)**2) +
-										2 * (self.S1 * self.BP)**2
-									)
-
-		if Irem ** 2 < self.BP ** 2:
-			RemRestSq = (2 * self.S1 ** 2 * np.abs(Irem) ** 2)
-		else:
-			RemRestSq = (
-										2 * ((self.S2 * Irem)**2 - (self.S2 * self.BP)**2) +
-										2 * (self.S1 * self.BP)**2
-									)
-	
-		return np.sqrt(LocRestSq + RemRestSq)
+	def __setattr__(self, name, value):
+		object.__setattr__(self, name, value)
+		if name != '_boundary':
+			object.__setattr__(self, '_boundary', None)
 
-	def trip(self, Iloc, Irem):
-		"""The trip decision is made by passing in the differential and restraint
-		currents along with the basic pickup. If the Severity calculation is > 0 a
-		trip is declared
-		"""
-		SA = self.diff(Iloc, Irem)**2 - (2 * self.P**2 + self.rest(Iloc, Irem)**2)
-		if SA > 0:
-			out = 'Trip'
-		else:
-			out = 'No Op'
-		return out
+	@property
+	def boundary(self):
+		"""the compiled Boundary of the present settings, see compile"""
+		if self._boundary is None:
+			self._boundary = self.compile()
+		return self._boundary
 
 	def diff(self, Iloc, Irem):
 		return np.abs(Iloc + Irem)
 
-	def sysvals(self, Irem=-1):
+	def trip(self, Iloc, Irem):
+		"""The trip decision is made by passing in the local and remote currents,
+		'Trip' or 'No Op' is returned for each point, see tripmask for the boolean
+		form
+		"""
+		return np.where(self.tripmask(Iloc, Irem)[0], 'Trip', 'No Op')[()]
+
+	def tripmask(self, Iloc, Irem):
+		"""The array form of trip, Iloc and Irem can be arrays of any shape that
+		broadcast together, real or complex phasors.
+			Output is the boolean trip mask, the differential and the restraint
+			currents
+		"""
+		diff = self.diff(Iloc, Irem)
+		rest = self.rest(Iloc, Irem)
+		return self.boundary.tripmask(diff, rest), diff, rest
+
+	def _margin(self, Iloc, Irem):
+		"""the severity for a pair of local and remote currents"""
+		return self.boundary.severity(self.diff(Iloc, Irem), self.rest(Iloc, Irem))
+
+	def diffn(self, I):
+		"""The differential current of a line with the terminal currents on the
+		last axis of I"""
+		return np.abs(np.sum(I, axis=-1))
+
+	def tripmaskn(self, I):
+		"""The trip mask of a line with the terminal currents on the last axis of
+		I, see tripmask"""
+		diff = self.diffn(I)
+		rest = self.restn(I)
+		return self.boundary.tripmask(diff, rest), diff, rest
+
+	def sysvals(self, Irem=-1, tol=1e-9, decimals=4):
 		"""sysvalues are used to calculate the operating point given a characteristic
 		and remote outflow current.
 			Inputs:
-					Irem = Remote Current (this should be set negative to show outflow)
-					S1 = Diff characteristic slope 1
-					S2 = Diff characteristic slope 2
-					BP = Slope 1 to 2 change over
-					P  = Pickup
+					Irem = Remote Current (this should be set negative to show outflow), can
+						be an array
+					tol = tolerance of the operating point
+					decimals = number of decimal places in the output, None for no rounding
 			Output is a dictionary that contains, Local and Remote Currents, Diff and
-			Restraint
+			Restraint. The local current is the first point above the remote outflow
+			that trips, nan where the characteristic does not trip
 		"""
-	
-		Iloc = - Irem
-		while self.trip(Iloc, Irem) == 'No Op':
-			Iloc += 0.001
-		return{
-			'Iloc': round(Iloc, 4),
-			'Irem': round(Irem, 4),
-			'Diff': round(self.diff(Iloc, Irem), 4),
-			'Rest': round(self.rest(Iloc, Irem), 4)
+		Irem = np.asarray(Irem, dtype=float)
+		Iloc = operatingpoint(self, Irem, tol=tol)
+		vals = {
+			'Iloc': Iloc,
+			'Irem': Irem,
+			'Diff': self.diff(Iloc, Irem),
+			'Rest': self.rest(Iloc, Irem)
 			}
+		if decimals is not None:
+			vals = {key: np.round(val, decimals) for key, val in vals.items()}
+		return {key: np.asarray(val)[()] for key, val in vals.items()}
 
 	def plotpairs(self, ascending=True, plotrange=10):
-		xvals = []
-		yvals = []
-		diffvals = []
-		restvals = []
-		for i in range(plotrange * 100):
-			Irem = i / 100
-			Iloc = - Irem
-			while self.trip(Iloc, Irem) == 'No Op':
-				if ascending:
-					Iloc += 0.01
-				else:
-					Iloc -= 0.01
-			xvals.append(Irem)
-			yvals.append(-Iloc)
-			diffvals.append(self.diff(Iloc, Irem))
-			restvals.append(self.rest(Iloc, Irem))
-		return xvals, yvals, diffvals, restvals
-	
-
-	def table(self, outflow=1):
-		"""the table function returns a table of results that show the resistive
-		coverage for different voltages and CT ratios. By changing the outflow value
-		from 1.0pu the system can be tested for different sensitivities.
-			Inputs:
-					outflow = amount of current leaving the remote end 1.0pu default
-					S1 = Diff characteristic slope 1
-					S2 = Diff characteristic slope 2
-					BP = Slope 1 to 2 change over
-					P  = Pickup
-		"""
-		voltages = [11, 22, 33, 66, 110, 132, 220]
-		cts = [100, 200, 400, 600, 800, 1200, 2000]
-		# Create and print a header row
-		hdr = '{:<8}'.format('CT Ratio')
-		for ct in cts:
-			hdr = hdr + str('{:8d}'.format(ct))
-		print(hdr)
-
-		for voltage in voltages:
-			vals = '{:<8}'.format(voltage)
-			for ct in cts:
-				PUDiff = self.sysvals(Irem=-outflow)['Diff']
-				Z = 1000 * voltage / (np.sqrt(3) * ct * PUDiff)
-				vals = vals + ' ' + str('{:7.2f}'.format(Z))
-			print(vals)
-		return{
-			'Pickup': self.P,
-			'S1': self.S1,
-			'S2': self.S2,
-			'BP': self.BP
-			}
+		"""returns the remote currents from 0 to plotrange in 0.01 steps with the
+		negated local current, diff and restraint at the operating point on one
+		branch of the envelope, see envelope for both branches"""
+		Irem = np.arange(plotrange * 100) / 100
+		Iloc = operatingpoint(self, Irem, ascending)
+		return Irem, -Iloc, self.diff(Iloc, Irem), self.rest(Iloc, Irem)
 
 
-class L90_3Term:
+class L90_3Term(_Compiled):
 	"""This class is used to store a GE L90 Line Diff Setting and to call
 	functions to describe it
 	"""
-	def __init__(self, S1=0.3, S2=0.5, BP=8, P=0.2, Sigma=0):
+	_degree = 2
+
+	def __init__(self, S1=0.3, S2=0.5, BP=8, P=0.2, Sigma=0, terminals=3):
 		self.S1 = S1
 		self.S2 = S2
 		self.BP = BP
 		self.P = P
 		self.Sigma = Sigma
+		self.terminals = terminals
 
 	def rest(self, Iloc, Irem):
 		"""The rest function calculates the restraint current for a line
@@ -150,82 +170,38 @@ class L90_3Term:
 					Iloc = Local Current
 					Irem = Remote Current (this should be set negative to show outflow)
 		"""
-		if Iloc ** 2 < self.BP ** 2:
-			LocRestSq = (4/3) * (self.S1 ** 2 * np.abs(Iloc) ** 2)
-		else:
-			LocRestSq = (
-										(4/3) * ((self.S2 * Iloc)**2 - (self.S2 * self.BP)**2) +
-										(4/3) * (self.S1 * self.BP)**2
-									)
-
-		if Irem ** 2 < self.BP ** 2:
-			RemRestSq = (4/3) * (self.S1 ** 2 * np.abs(Irem) ** 2)
-		else:
-			RemRestSq = (
-										(4/3) * ((self.S2 * Irem) ** 2 - (self.S2 * self.BP) ** 2) +
-										(4/3) * (self.S1 * self.BP) ** 2
-									)
-	
-		return np.sqrt(LocRestSq + RemRestSq)
-
-	def trip(self, Iloc, Irem):
-		"""The trip decision is made by passing in the differential and restraint
-		currents along with the basic pickup. If the Severity calculation is > 0 a
-		trip is declared
-		"""
-		SA = self.diff(Iloc, Irem)**2 - (2 * self.P**2 + self.rest(Iloc, Irem)**2)
-		if SA > 0:
-			out = 'Trip'
-		else:
-			out = 'No Op'
-		return out
-
-	def diff(self, Iloc, Irem):
-		return np.abs(Iloc + Irem)
-		
-	def sysvals(self, Irem=-1):
-		"""sysvalues are used to calculate the operating point given a characteristic
-		and remote outflow current.
-			Inputs:
-					Irem = Remote Current (this should be set negative to show outflow)
-					S1 = Diff characteristic slope 1
-					S2 = Diff characteristic slope 2
-					BP = Slope 1 to 2 change over
-					P  = Pickup
-			Output is a dictionary that contains, Local and Remote Currents, Diff and
-			Restraint
-		"""
-	
-		Iloc = - Irem
-		while self.trip(Iloc, Irem) == 'No Op':
-			Iloc += 0.001
-		return{
-			'Iloc': round(Iloc, 4),
-			'Irem': round(Irem, 4),
-			'Diff': round(self.diff(Iloc, Irem), 4),
-			'Rest': round(self.rest(Iloc, Irem), 4)
-			}
-
-	def plotpairs(self, ascending=True, plotrange=10):
-		xvals = []
-		yvals = []
-		diffvals = []
-		restvals = []
-		for i in range(plotrange * 100):
-			Irem = i / 100
-			Iloc = - Irem
-			while self.trip(Iloc, Irem) == 'No Op':
-				if ascending:
-					Iloc += 0.01
-				else:
-					Iloc -= 0.01
-			xvals.append(Irem)
-			yvals.append(-Iloc)
-			diffvals.append(self.diff(Iloc, Irem))
-			restvals.append(self.rest(Iloc, Irem))
-		return xvals, yvals, diffvals, restvals
+		return np.sqrt(self._restsq(Iloc) + self._restsq(Irem))
+
+	def _restsq(self, I):
+		"""the squared restraint of one terminal, the slope changes from S1 to S2
+		at the breakpoint BP and the multiplier is 4 / terminals"""
+		Isq = np.abs(I) ** 2
+		return 4 / self.terminals * np.where(
+			Isq < self.BP ** 2,
+			self.S1 ** 2 * Isq,
+			self.S2 ** 2 * (Isq - self.BP ** 2) + (self.S1 * self.BP) ** 2
+			)
+
+	def compile(self):
+		"""Compiles the characteristic into a Boundary in the diff-restraint plane,
+		the severity diff**2 - (2 * P**2 + rest**2) is positive where it trips.
+		Along a line of constant remote current this is a quadratic between the
+		breaks."""
+		return Boundary([[0, 2 * self.P**2, 0, 1]], power=2)
+
+	def _breaks(self, Irem):
+		"""the local currents where the form of the margin changes for each remote
+		current"""
+		Irem = np.asarray(Irem, dtype=float)
+		return np.stack([Irem * 0 - self.BP, Irem * 0 + self.BP], axis=-1)
+
+	def restn(self, I):
+		"""The restraint current of a line with up to terminals ends, the terminal
+		currents are on the last axis of I. The squared restraint of every
+		terminal is added with the 4 / terminals multiplier."""
+		I = _terminals(self, I, self.terminals)
+		return np.sqrt(np.sum(self._restsq(I), axis=-1))
 
-	
 	def table(self, outflow=1):
 		"""the table function returns a table of results that show the resistive
 		coverage for different voltages and CT ratios. By changing the outflow value
@@ -245,12 +221,11 @@ class L90_3Term:
 			hdr = hdr + str('{:8d}'.format(ct))
 		print(hdr)
 
-		for voltage in voltages:
+		Z = coverage(self, voltages, cts, outflow)[:, :, 0]
+		for voltage, row in zip(voltages, Z):
 			vals = '{:<8}'.format(voltage)
-			for ct in cts:
-				PUDiff = self.sysvals(Irem=-outflow)['Diff']
-				Z = 1000 * voltage / (np.sqrt(3) * ct * PUDiff)
-				vals = vals + ' ' + str('{:7.2f}'.format(Z))
+			for z in row:
+				vals = vals + ' ' + str('{:7.2f}'.format(z))
 			print(vals)
 		return{
 			'Pickup': self.P,
@@ -260,10 +235,21 @@ class L90_3Term:
 			}
 
 
-class P543:
+class L90_2Term(L90_3Term):
+	"""This class is used to store a GE L90 Line Diff Setting for a two terminal
+	line and to call functions to describe it, see L90_3Term
+	"""
+
+	def __init__(self, S1=0.3, S2=0.5, BP=8, P=0.2, Sigma=0):
+		super().__init__(S1, S2, BP, P, Sigma, terminals=2)
+
+
+class P543(_Compiled):
 	"""This class is used to store a P543 Line Diff Setting and to call
 	functions to describe it
 	"""
+	_degree = 1
+
 	def __init__(self, IS1=0.2, IS2=2, K1=0.2, K2=1.5):
 		self.IS1 = IS1
 		self.IS2 = IS2
@@ -281,26 +267,27 @@ class P543:
 	
 		return (np.abs(Iloc) + np.abs(Irem)) / 2
 
-	def diff(self, Iloc, Irem):
-		return np.abs(Iloc + Irem)
-
-	def trip(self, Iloc, Irem):
-		"""The trip decision is made by passing in the differential and restraint
-		currents along with the basic pickup. If the Severity calculation is > 1 a
-		trip is declared
-		"""
-		out = 'No Op'
-		if self.rest(Iloc, Irem) < self.IS2:
-			if self.diff(Iloc, Irem) > (self.rest(Iloc, Irem) * self.K1 + self.IS1):
-				out = 'Trip'
-		else:
-			restraint = (
-									self.K2 * self.rest(Iloc, Irem) + (self.K1 - self.K2) *
-									self.IS2 + self.IS1
-									)
-			if self.diff(Iloc, Irem) > restraint:
-				out = 'Trip'
-		return out
+	def compile(self):
+		"""Compiles the characteristic into a Boundary in the diff-restraint plane,
+		slope K1 from the pickup IS1 up to a restraint of IS2 and then slope K2.
+		Along a line of constant remote current this is linear between the
+		breaks."""
+		return Boundary([
+			[0, self.IS1, self.K1, 0],
+			[self.IS2, (self.K1 - self.K2) * self.IS2 + self.IS1, self.K2, 0]
+			])
+
+	def _breaks(self, Irem):
+		"""the local currents where the form of the margin changes for each remote
+		current"""
+		Irem = np.asarray(Irem, dtype=float)
+		edge = 2 * self.IS2 - np.abs(Irem)
+		return np.stack([-edge, edge, Irem * 0], axis=-1)
+
+	def restn(self, I):
+		"""The bias current of a line with any number of terminals, half the sum of
+		the terminal current magnitudes on the last axis of I"""
+		return 0.5 * np.sum(np.abs(I), axis=-1)
 
 	def table(self, outflow=1):
 		"""the table function returns a table of results that show the resistive
@@ -321,12 +308,11 @@ class P543:
 			hdr = hdr + str('{:8d}'.format(ct))
 		print(hdr)
 
-		for voltage in voltages:
+		Z = coverage(self, voltages, cts, outflow)[:, :, 0]
+		for voltage, row in zip(voltages, Z):
 			vals = '{:<8}'.format(voltage)
-			for ct in cts:
-				PUDiff = self.sysvals(Irem=-outflow)['Diff']
-				Z = 1000 * voltage / (np.sqrt(3) * ct * PUDiff)
-				vals = vals + ' ' + str('{:7.2f}'.format(Z))
+			for z in row:
+				vals = vals + ' ' + str('{:7.2f}'.format(z))
 			print(vals)
 		return{
 			'IS1': self.IS1,
@@ -335,49 +321,13 @@ class P543:
 			'IS2': self.IS2
 			}
 
-	def sysvals(self, Irem=-1):
-		"""sysvalues are used to calculate the operating point given a characteristic
-		and remote outflow current.
-			Inputs:
-					Irem = Remote Current (this should be set negative to show outflow)
-			Output is a dictionary that contains, Local and Remote Currents, Diff and
-			Restraint
-		"""
-	
-		Iloc = - Irem
-		while self.trip(Iloc, Irem) == 'No Op':
-			Iloc += 0.001
-		return{
-			'Iloc': round(Iloc, 4),
-			'Irem': round(Irem, 4),
-			'Diff': round(self.diff(Iloc, Irem), 4),
-			'Rest': round(self.rest(Iloc, Irem), 4)
-			}
 
-	def plotpairs(self, ascending=True, plotrange=10):
-		xvals = []
-		yvals = []
-		diffvals = []
-		restvals = []
-		for i in range(plotrange * 100):
-			Irem = i / 100
-			Iloc = - Irem
-			while self.trip(Iloc, Irem) == 'No Op':
-				if ascending:
-					Iloc += 0.01
-				else:
-					Iloc -= 0.01
-			xvals.append(Irem)
-			yvals.append(-Iloc)
-			diffvals.append(self.diff(Iloc, Irem))
-			restvals.append(self.rest(Iloc, Irem))
-		return xvals, yvals, diffvals, restvals
-
-
-class RED615:
+class RED615(_Compiled):
 	"""This class is used to store a P543 Line Diff Setting and to call
 	functions to describe it
 	"""
+	_degree = 1
+
 	def __init__(self, ES1=1, ES2=5, Pickup=0.1, S2=0.5, S3=1.5):
 		self.ES1 = ES1
 		self.ES2 = ES2
@@ -396,26 +346,42 @@ class RED615:
 	
 		return np.abs(Iloc - Irem) / 2
 
-	def diff(self, Iloc, Irem):
-		return np.abs(Iloc + Irem)
-
-	def trip(self, Iloc, Irem):
-		"""The trip decision is made by passing in the local and remote
-		currents.
-		"""
-		out = 'No Op'
-		if self.rest(Iloc, Irem) < self.ES1:
-			if self.diff(Iloc, Irem) >= self.Pickup:
-				out = 'Trip'
-		elif self.rest(Iloc, Irem) < self.ES2:
-			Rest = self.rest(Iloc, Irem) * self.S2 - self.S2 * self.ES1 + self.Pickup
-			if self.diff(Iloc, Irem) >= Rest:
-				out = 'Trip'
-		else:
-			Rest = self.S3 + self.ES2 * (self.S2 + self.S3) - self.S2 * self.ES1 + self.Pickup
-			if self.diff(Iloc, Irem) >= Rest:
-				out = ' Trip'
-		return out
+	def compile(self):
+		"""Compiles the characteristic into a Boundary in the diff-restraint plane,
+		the pickup up to a restraint of ES1, slope S2 up to ES2 and then the third
+		region threshold. The boundary is inclusive. Along a line of constant remote
+		current this is linear between the breaks."""
+		return Boundary([
+			[0, self.Pickup, 0, 0],
+			[self.ES1, self.Pickup - self.S2 * self.ES1, self.S2, 0],
+			[
+				self.ES2,
+				self.S3 + self.ES2 * (self.S2 + self.S3) - self.S2 * self.ES1 +
+				self.Pickup,
+				0, 0
+				]
+			], inclusive=True)
+
+	def _breaks(self, Irem):
+		"""the local currents where the form of the margin changes for each remote
+		current"""
+		Irem = np.asarray(Irem, dtype=float)
+		return np.stack([
+			Irem - 2 * self.ES2, Irem - 2 * self.ES1, Irem,
+			Irem + 2 * self.ES1, Irem + 2 * self.ES2
+			], axis=-1)
+
+	def diffn(self, I):
+		"""The differential current with the local and remote currents on the last
+		axis of I, the characteristic has two terminals"""
+		I = _terminals(self, I, 2, exact=True)
+		return self.diff(I[..., 0], I[..., 1])
+
+	def restn(self, I):
+		"""The restraint current with the local and remote currents on the last
+		axis of I, the characteristic has two terminals"""
+		I = _terminals(self, I, 2, exact=True)
+		return self.rest(I[..., 0], I[..., 1])
 
 	def table(self, outflow=1):
 		"""the table function returns a table of results that show the resistive
@@ -436,12 +402,11 @@ class RED615:
 			hdr = hdr + str('{:8d}'.format(ct))
 		print(hdr)
 
-		for voltage in voltages:
+		Z = coverage(self, voltages, cts, outflow)[:, :, 0]
+		for voltage, row in zip(voltages, Z):
 			vals = '{:<8}'.format(voltage)
-			for ct in cts:
-				PUDiff = self.sysvals(Irem=-outflow)['Diff']
-				Z = 1000 * voltage / (np.sqrt(3) * ct * PUDiff)
-				vals = vals + ' ' + str('{:7.2f}'.format(Z))
+			for z in row:
+				vals = vals + ' ' + str('{:7.2f}'.format(z))
 			print(vals)
 		return{
 			'ES1': self.ES1,
@@ -451,49 +416,13 @@ class RED615:
 			'Pickip': self.Pickup
 			}
 
-	def sysvals(self, Irem=-1):
-		"""sysvalues are used to calculate the operating point given a characteristic
-		and remote outflow current.
-			Inputs:
-					Irem = Remote Current (this should be set negative to show outflow)
-			Output is a dictionary that contains, Local and Remote Currents, Diff and
-			Restraint
-		"""
-	
-		Iloc = - Irem
-		while self.trip(Iloc, Irem) == 'No Op':
-			Iloc += 0.001
-		return{
-			'Iloc': round(Iloc, 4),
-			'Irem': round(Irem, 4),
-			'Diff': round(self.diff(Iloc, Irem), 4),
-			'Rest': round(self.rest(Iloc, Irem), 4)
-			}
-
-	def plotpairs(self, ascending=True, plotrange=10):
-		xvals = []
-		yvals = []
-		diffvals = []
-		restvals = []
-		for i in range(plotrange * 100):
-			Irem = i / 100
-			Iloc = - Irem
-			while self.trip(Iloc, Irem) == 'No Op':
-				if ascending:
-					Iloc += 0.01
-				else:
-					Iloc -= 0.01
-			xvals.append(Irem)
-			yvals.append(-Iloc)
-			diffvals.append(self.diff(Iloc, Irem))
-			restvals.append(self.rest(Iloc, Irem))
-		return xvals, yvals, diffvals, restvals
-
 
 class SEL311L:
 	"""This class is used to store a P543 Line Diff Setting and to call
 	functions to describe it
 	"""
+	_degree = 0
+
 	def __init__(self, ANG87=195, K=6, LPP87=1.2):
 		self.K = K
 		self.ANG87 = ANG87
@@ -503,21 +432,68 @@ class SEL311L:
 		return np.abs(Iloc + Irem)
 
 	def trip(self, Iloc, Irem):
-		"""The trip decision
+		"""The trip decision is made by passing in the local and remote currents,
+		'Trip' or 'No Op' is returned for each point, see tripmask for the boolean
+		form
+		"""
+		return np.where(self.tripmask(Iloc, Irem)[0], 'Trip', 'No Op')[()]
+
+	def tripmask(self, Iloc, Irem):
+		"""The array form of trip, Iloc and Irem can be arrays of any shape that
+		broadcast together, real or complex phasors. The decision is made in the
+		alpha plane, see alphaplane.
+			Output is the boolean trip mask, the differential current and None as the
+			characteristic has no restraint current
 		"""
-		out = 'No Op'
-		if self.diff(Iloc, Irem) > self.LPP87:
-			if np.abs(Iloc) > 0.05:
-				if np.abs(Irem) > 0.05:
-					if Iloc / Irem < - self.K:
-						out = 'Trip'
-					elif Iloc / Irem > - 1 / self.K:
-						out = 'Trip'
-				else:
-					out = 'Trip'
-			else:
-				out = 'Trip'
-		return out
+		diff = self.diff(Iloc, Irem)
+		return (diff > self.LPP87) & ~self.alphaplane(Iloc, Irem)[0], diff, None
+
+	def alphaplane(self, Iloc, Irem):
+		"""Evaluates the alpha plane restraint region for arrays of local and remote
+		current phasors. The ratio k = Irem / Iloc is restrained where 1/K <= |k| <= K
+		and the angle of k is within ANG87 / 2 of 180 degrees. Where either current
+		is 0.05 or less the ratio is not used and the point is not restrained.
+			Output is the boolean restrained mask and the complex ratio, nan where it
+			is not used
+		"""
+		Iloc = np.asarray(Iloc)
+		Irem = np.asarray(Irem)
+		valid = (np.abs(Iloc) > 0.05) & (np.abs(Irem) > 0.05)
+		with np.errstate(divide='ignore', invalid='ignore'):
+			ratio = np.where(valid, Irem / np.where(valid, Iloc, 1), np.nan)
+		radius = np.abs(ratio)
+		blocked = 180 - np.abs(np.angle(ratio, deg=True))
+		restrained = (
+			valid & (radius >= 1 / self.K) & (radius <= self.K) &
+			(blocked <= self.ANG87 / 2)
+			)
+		return restrained, ratio[()]
+
+	def _margin(self, Iloc, Irem):
+		"""1 where the characteristic trips and -1 where it does not, this is
+		constant between the breaks"""
+		return np.where(self.tripmask(Iloc, Irem)[0], 1.0, -1.0)
+
+	def _breaks(self, Irem):
+		"""the local currents where the trip decision can change for each remote
+		current"""
+		Irem = np.asarray(Irem, dtype=float)
+		return np.stack([
+			- Irem - self.LPP87, - Irem + self.LPP87, Irem * 0 - 0.05,
+			Irem * 0 + 0.05, - self.K * Irem, - Irem / self.K
+			], axis=-1)
+
+	def diffn(self, I):
+		"""The differential current with the local and remote currents on the last
+		axis of I, the characteristic has two terminals"""
+		I = _terminals(self, I, 2, exact=True)
+		return self.diff(I[..., 0], I[..., 1])
+
+	def tripmaskn(self, I):
+		"""The trip mask with the local and remote currents on the last axis of I,
+		see tripmask"""
+		I = _terminals(self, I, 2, exact=True)
+		return self.tripmask(I[..., 0], I[..., 1])
 
 	def table(self, outflow=1):
 		"""the table function returns a table of results that show the resistive
@@ -538,74 +514,202 @@ class SEL311L:
 			hdr = hdr + str('{:8d}'.format(ct))
 		print(hdr)
 
-		for voltage in voltages:
+		Z = coverage(self, voltages, cts, outflow)[:, :, 0]
+		for voltage, row in zip(voltages, Z):
 			vals = '{:<8}'.format(voltage)
-			for ct in cts:
-				PUDiff = self.sysvals(Irem=-outflow)['Diff']
-				Z = 1000 * voltage / (np.sqrt(3) * ct * PUDiff)
-				vals = vals + ' ' + str('{:7.2f}'.format(Z))
+			for z in row:
+				vals = vals + ' ' + str('{:7.2f}'.format(z))
 			print(vals)
 		return{
 			'87LANG': self.ANG87,
 			'K': self.K,
 			}
 
-	def sysvals(self, Irem=-1):
+	def sysvals(self, Irem=-1, tol=1e-9, decimals=4):
 		"""sysvalues are used to calculate the operating point given a characteristic
 		and remote outflow current.
 			Inputs:
-					Irem = Remote Current (this should be set negative to show outflow)
-			Output is a dictionary that contains, Local and Remote Currents, Diff and
-			Restraint
+					Irem = Remote Current (this should be set negative to show outflow), can
+						be an array
+					tol = tolerance of the operating point
+					decimals = number of decimal places in the output, None for no rounding
+			Output is a dictionary that contains, Local and Remote Currents and Diff.
+			The local current is the first point above the remote outflow
+			that trips, nan where the characteristic does not trip
 		"""
-	
-		Iloc = - Irem
-		while self.trip(Iloc, Irem) == 'No Op':
-			Iloc += 0.01
-		return{
-			'Iloc': round(Iloc, 4),
-			'Irem': round(Irem, 4),
-			'Diff': round(self.diff(Iloc, Irem), 4)
+		Irem = np.asarray(Irem, dtype=float)
+		Iloc = operatingpoint(self, Irem, tol=tol)
+		vals = {
+			'Iloc': Iloc,
+			'Irem': Irem,
+			'Diff': self.diff(Iloc, Irem)
 			}
+		if decimals is not None:
+			vals = {key: np.round(val, decimals) for key, val in vals.items()}
+		return {key: np.asarray(val)[()] for key, val in vals.items()}
 
 	def plotpairs(self, ascending=True, plotrange=10):
-		xvals = []
-		yvals = []
-		diffvals = []
-		for i in range(plotrange * 100):
-			Irem = i / 100
-			Iloc = - Irem
-			while self.trip(Iloc, Irem) == 'No Op':
-				if ascending:
-					Iloc += 0.01
-				else:
-					Iloc -= 0.01
-			xvals.append(Irem)
-			yvals.append(-Iloc)
-			diffvals.append(self.diff(Iloc, Irem))
-		return xvals, yvals, diffvals
+		"""returns the remote currents from 0 to plotrange in 0.01 steps with the
+		negated local current and diff at the operating point on one branch of the
+		envelope, see envelope for both branches"""
+		Irem = np.arange(plotrange * 100) / 100
+		Iloc = operatingpoint(self, Irem, ascending)
+		return Irem, -Iloc, self.diff(Iloc, Irem)
+
+
+def _terminals(device, I, limit, exact=False):
+	"""checks the number of terminals on the last axis of I"""
+	I = np.asarray(I)
+	N = I.shape[-1] if I.ndim else 0
+	if N > limit or N < 1 or (exact and N != limit):
+		raise ValueError('{} supports {} {} terminals, not {}'.format(
+			type(device).__name__, 'exactly' if exact else 'up to', limit, N
+			))
+	return I
+
+
+def operatingpoint(device, Irem=-1, ascending=True, tol=1e-9, smax=1000):
+	"""Finds the first local current that trips the characteristic when the local
+	current is moved away from the through fault point Iloc = -Irem, where the
+	differential current is zero. Along this line the differential current is the
+	distance moved and the characteristic margin is a polynomial between the
+	breaks of the characteristic, so each piece is solved in closed form. Where
+	a piece can not be solved this way the crossing is found by bisection.
+		Inputs:
+				device = a differential characteristic, for example P543()
+				Irem = Remote Current (this should be set negative to show outflow), can
+					be an array
+				ascending = True to increase the local current, False to reduce it
+				tol = tolerance of the operating point
+				smax = the largest differential current searched
+		Output is the local current at the operating point for each remote current,
+		nan where the characteristic does not trip up to smax
+	"""
+	Irem = np.asarray(Irem, dtype=float)
+	sign = 1 if ascending else -1
+	s = _raysolve(device, Irem.ravel(), sign, tol, smax)
+	return (- Irem + sign * s.reshape(Irem.shape))[()]
+
+
+def _raysolve(device, Irem, sign, tol, smax):
+	"""returns the differential current at the first trip along the line
+	Iloc = -Irem + sign * s for a vector of remote currents"""
+	def margin(s, Irem):
+		return device._margin(- Irem[:, None] + sign * s, Irem[:, None])
+
+	# pieces between the breaks of the characteristic along each line
+	breaks = sign * (device._breaks(Irem) + Irem[:, None])
+	breaks = np.where((breaks > 0) & (breaks < smax), breaks, smax)
+	edges = np.concatenate((
+		np.zeros((Irem.size, 1)), np.sort(breaks, axis=1),
+		np.full((Irem.size, 1), smax)
+		), axis=1)
+	lo, width = edges[:, :-1], np.diff(edges, axis=1)
+
+	# fit the polynomial of each piece through interior nodes and take the
+	# smallest start or root of a piece after which the characteristic trips
+	degree = getattr(device, '_degree', None)
+	result = np.full(Irem.size, np.nan)
+	if degree is not None:
+		nodes = np.arange(1, degree + 2) / (degree + 2)
+		values = np.stack([margin(lo + f * width, Irem) for f in nodes], axis=-1)
+		coef = values @ np.linalg.inv(np.vander(nodes, increasing=True)).T
+		candidates = [np.zeros(lo.shape)]
+		with np.errstate(divide='ignore', invalid='ignore'):
+			if degree == 1:
+				candidates.append(- coef[..., 0] / coef[..., 1])
+			elif degree == 2:
+				c0, c1, c2 = coef[..., 0], coef[..., 1], coef[..., 2]
+				root = np.sqrt(c1**2 - 4 * c0 * c2)
+				q = -0.5 * (c1 + np.copysign(root, c1))
+				candidates += [q / c2, c0 / q, np.where(c2 == 0, - c0 / c1, np.nan)]
+		for u in candidates:
+			u = np.where((u >= -1e-12) & (u <= 1 + 1e-12), np.clip(u, 0, 1), np.nan)
+			point = lo + u * width
+			trips = margin(np.nan_to_num(point) + tol, Irem) > 0
+			point = np.where(trips & np.isfinite(point), point, np.inf)
+			result = np.fmin(result, point.min(axis=1))
+		result[np.isinf(result)] = np.nan
+
+	# bracket the first tripping node of the unsolved lines and bisect
+	todo = np.flatnonzero(np.isnan(result))
+	if todo.size:
+		# the last node of each piece is just inside its end
+		fractions = np.linspace(0, 1, 9)[1:]
+		grid = lo[todo, :, None] + np.maximum(
+			width[todo, :, None] * fractions - tol, 0
+			)
+		grid = grid.reshape(todo.size, -1)
+		tripped = margin(grid, Irem[todo]) > 0
+		found = tripped.any(axis=1)
+		first = np.argmax(tripped, axis=1)
+		a = np.where(first > 0, grid[np.arange(todo.size), first - 1], 0)
+		b = grid[np.arange(todo.size), first]
+		for i in range(200):
+			if np.all(b - a <= tol):
+				break
+			mid = (a + b) / 2
+			trips = margin(mid[:, None], Irem[todo])[:, 0] > 0
+			a, b = np.where(trips, a, mid), np.where(trips, mid, b)
+		result[todo] = np.where(found, b, np.nan)
+	return result
+
+
+def envelope(device, Irem=None, plotrange=10, tol=1e-9):
+	"""Calculates both branches of the operating envelope of a differential
+	characteristic, the upper branch is found by increasing the local current
+	from the through fault point Iloc = -Irem and the lower branch by reducing it.
+		Inputs:
+				device = a differential characteristic, for example P543()
+				Irem = array of remote currents, by default 0 to plotrange in 0.01 steps
+				plotrange = the largest remote current where Irem is not given
+				tol = tolerance of the operating points
+		Output is a dictionary that contains the remote currents and the local
+		currents on the Upper and Lower branches, nan where there is no trip
+	"""
+	if Irem is None:
+		Irem = np.arange(plotrange * 100) / 100
+	Irem = np.asarray(Irem, dtype=float)
+	return {
+		'Irem': Irem,
+		'Upper': operatingpoint(device, Irem, True, tol),
+		'Lower': operatingpoint(device, Irem, False, tol)
+		}
+
+
+def coverage(device, voltages, cts, outflows=1, tol=1e-9):
+	"""Calculates the fault resistance coverage of a differential characteristic
+	for every combination of system voltage, CT primary and remote outflow. The
+	operating point is solved once for each distinct outflow and the resistance
+	is broadcast over the voltages and CT ratios.
+		Inputs:
+				device = a differential characteristic, for example P543()
+				voltages = system voltages in kV
+				cts = CT primary currents in A
+				outflows = per unit currents leaving the remote end
+				tol = tolerance of the operating points
+		Output is a V x C x O array of the fault resistance in ohms that just
+		operates the characteristic, nan where it does not operate
+	"""
+	voltages = np.atleast_1d(np.asarray(voltages, dtype=float))
+	cts = np.atleast_1d(np.asarray(cts, dtype=float))
+	outflows = np.atleast_1d(np.asarray(outflows, dtype=float))
+	unique, inverse = np.unique(outflows, return_inverse=True)
+	Irem = - unique
+	diff = device.diff(operatingpoint(device, Irem, tol=tol), Irem)[inverse]
+	with np.errstate(divide='ignore'):
+		return (
+			1000 * voltages[:, None, None] /
+			(np.sqrt(3) * cts[None, :, None] * diff.reshape(1, 1, -1))
+			)
 
 
 def plotcurve(device, plotrange=10):
+	"""Plots the operating envelope of a differential characteristic"""
+	env = envelope(device, plotrange=plotrange)
 	fig = plt.figure()
-	plt.plot(
-		device.plotpairs(
-				ascending=False,
-				plotrange=plotrange
-				)[0],
-		device.plotpairs(
-				ascending=False,
-				plotrange=plotrange
-				)[1]
-		)
-	plt.plot(
-		device.plotpairs(
-				plotrange=plotrange
-				)[0],
-				device.plotpairs(
-				plotrange=plotrange
-				)[1]
-				)
+	plt.plot(env['Irem'], -env['Lower'])
+	plt.plot(env['Irem'], -env['Upper'])
 	plt.xlim(0, plotrange)
 	plt.ylim(0, plotrange)
 	plt.grid(True)
@@ -615,20 +719,84 @@ def plotcurve(device, plotrange=10):
 	plt.show()
 
 
-def printcurves(device, voltage):
-	fig = plt.figure()
-	cts = [100, 200, 400, 600, 800, 1200, 2000]
-	
-	for ct in cts:
-		xvals = []
-		yvals = []
-		for i in range(20, 1001):
-			xvals.append(i / 1000)
-			yvals.append(voltage / (np.sqrt(3) * ct * device.sysvals(-i / 1000)['Diff']))
-		plt.plot(xvals, yvals, label=str(ct))
+def stabilitymap(device, current, asymmetry, phaseerror, ratio=1,
+		frequency=50):
+	"""Evaluates a differential characteristic for an external fault over a grid
+	of channel asymmetries and CT phase errors. The remote current leaves the
+	line with its angle shifted by half of the channel asymmetry (the error of a
+	ping-pong time alignment) plus the phase error, and its magnitude scaled by
+	ratio for CT ratio error or saturation.
+		Inputs:
+				device = a differential characteristic, for example SEL311L()
+				current = through fault current in per unit
+				asymmetry = array of differences between the go and return channel
+					delays in ms
+				phaseerror = array of CT phase errors in degrees
+				ratio = magnitude of the remote current relative to the local current,
+					a scalar or an array that broadcasts to the grid
+				frequency = system frequency in Hz
+		Output is a dictionary that contains the A x P array of the angle error in
+		degrees and the A x P array of the Trip mask, True where the
+		characteristic maloperates
+	"""
+	asymmetry = np.asarray(asymmetry, dtype=float)
+	phaseerror = np.asarray(phaseerror, dtype=float)
+	angle = (
+		asymmetry[:, None] / 2000 * 360 * frequency + phaseerror[None, :]
+		)
+	Irem = - current * np.asarray(ratio) * np.exp(1j * np.radians(angle))
+	return {'Angle': angle, 'Trip': device.tripmask(current, Irem)[0]}
+
+
+def resistancecurves(device, voltage, cts=None, currents=None, tol=1e-9):
+	"""Calculates the fault resistance coverage against the per unit remote
+	outflow for a set of CT ratios. The operating point is solved for the whole
+	current vector once and broadcast over the CT ratios.
+		Inputs:
+				device = a differential characteristic, for example P543()
+				voltage = system voltage in volts
+				cts = CT primary currents, by default 100 to 2000
+				currents = per unit outflow currents, by default 0.02 to 1.0 in 0.001
+					steps
+				tol = tolerance of the operating points
+		Output is a dictionary that contains the Current vector, the CT list and the
+		C x P array of Resistance in ohms
+	"""
+	if cts is None:
+		cts = [100, 200, 400, 600, 800, 1200, 2000]
+	if currents is None:
+		currents = np.arange(20, 1001) / 1000
+	currents = np.asarray(currents, dtype=float)
+	return {
+		'Current': currents,
+		'CT': list(cts),
+		'Resistance': coverage(device, voltage / 1000, cts, currents, tol)[0]
+		}
+
+
+def printcurves(device, voltage, filename=None):
+	"""Plots the fault resistance coverage against the per unit outflow for each
+	CT ratio, see resistancecurves. Where a filename is given the chart is drawn
+	without a display and written to the file, otherwise it is shown. The curve
+	data is returned.
+	"""
+	curves = resistancecurves(device, voltage)
+	if filename is None:
+		fig = plt.figure()
+		ax = fig.gca()
+	else:
+		fig = Figure()
+		FigureCanvasAgg(fig)
+		ax = fig.add_subplot()
+	for ct, resistance in zip(curves['CT'], curves['Resistance']):
+		ax.plot(curves['Current'], resistance, label=str(ct))
 	fig.suptitle('Voltage ' + str(voltage / 1000) + 'kV')
-	plt.legend(title='CT Prim')
-	plt.xlabel('Per Unit Current')
-	plt.ylabel('Resistance (ohms)')
-	plt.grid(True)
-	plt.show()
+	ax.legend(title='CT Prim')
+	ax.set_xlabel('Per Unit Current')
+	ax.set_ylabel('Resistance (ohms)')
+	ax.grid(True)
+	if filename is None:
+		plt.show()
+	else:
+		fig.savefig(filename)
+	return curves
@@ -0,0 +1,67 @@
+import numpy as np
+
+
+def faultstudy(relays, faults, distribution, buses=None, faulttypes=None,
+		sources=None):
+	"""Evaluates the response of a group of overcurrent relays to every case of a
+	short circuit study. The current each relay sees is its share of the bus fault
+	current and the operating times of all relays for all cases are calculated
+	together.
+		Inputs:
+				relays = list of R overcurrent.Relay objects
+				faults = B x T x S array of fault currents for each bus, fault type and
+					source condition (for example maximum and minimum source)
+				distribution = R x B array of the fraction of each bus fault current
+					that flows through each relay, 0 where the relay does not see the
+					fault. An array that broadcasts to R x B x T x S can be used where the
+					share depends on the fault type or source condition
+				buses = list of B bus names, by default the bus number is used
+				faulttypes = list of T fault type names
+				sources = list of S source condition names, Max and Min by default for
+					two conditions
+		Output is a structured array with a record for each of the B x T x S cases
+		containing the bus, fault type and source names, the current seen and the
+		operating time of each relay (inf where it does not operate), the relay
+		numbers in the order they operate and the first relay to operate (-1 where
+		no relay operates).
+	"""
+	faults = np.asarray(faults, dtype=float)
+	B, T, S = faults.shape
+	R = len(relays)
+	distribution = np.asarray(distribution, dtype=float)
+	if distribution.ndim == 2:
+		distribution = distribution[:, :, None, None]
+	seen = np.abs(np.broadcast_to(distribution * faults, (R, B, T, S)))
+
+	times = np.stack([relay.getoptime(seen[r]) for r, relay in enumerate(relays)])
+	times = np.moveaxis(times, 0, -1).reshape(-1, R)
+	order = np.argsort(times, axis=1, kind='stable')
+	first = np.where(np.isfinite(times.min(axis=1, initial=np.inf)), order[:, 0], -1)
+
+	if buses is None:
+		buses = [str(bus + 1) for bus in range(B)]
+	if faulttypes is None:
+		faulttypes = [str(fault + 1) for fault in range(T)]
+	if sources is None:
+		sources = ['Max', 'Min'] if S == 2 else [str(s + 1) for s in range(S)]
+	bus, fault, source = np.meshgrid(
+		np.arange(B), np.arange(T), np.arange(S), indexing='ij'
+		)
+
+	result = np.zeros(B * T * S, dtype=[
+		('Bus', 'U32'),
+		('Fault', 'U16'),
+		('Source', 'U16'),
+		('Current', float, (R,)),
+		('Time', float, (R,)),
+		('Order', int, (R,)),
+		('First', int)
+		])
+	result['Bus'] = np.asarray(buses)[bus.ravel()]
+	result['Fault'] = np.asarray(faulttypes)[fault.ravel()]
+	result['Source'] = np.asarray(sources)[source.ravel()]
+	result['Current'] = np.moveaxis(seen, 0, -1).reshape(-1, R)
+	result['Time'] = times
+	result['Order'] = order
+	result['First'] = first
+	return result
@@ -0,0 +1,249 @@
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+
+import numpy as np
+
+
+def wilson(failures, samples, confidence=0.95):
+	"""returns the lower and upper limits of the Wilson score interval for a
+	proportion of failures in samples, the inputs can be arrays"""
+	failures = np.asarray(failures, dtype=float)
+	samples = np.asarray(samples, dtype=float)
+	z = NormalDist().inv_cdf(0.5 + confidence / 2)
+	p = failures / samples
+	centre = (p + z**2 / (2 * samples)) / (1 + z**2 / samples)
+	spread = (
+		z * np.sqrt(p * (1 - p) / samples + z**2 / (4 * samples**2)) /
+		(1 + z**2 / samples)
+		)
+	lower = np.where(failures > 0, np.maximum(centre - spread, 0), 0)
+	upper = np.where(failures < samples, np.minimum(centre + spread, 1), 1)
+	return lower[()], upper[()]
+
+
+def miscoordination(pairs, Ifault, samples=10**6, margin=0.1, share=1,
+		pickuptol=0.05, timetol=0.05, cttol=0.03, faulttol=0.1,
+		distribution='uniform', confidence=0.95, chunksize=2**18, processes=1,
+		seed=None):
+	"""Estimates the probability that an upstream relay operates before the
+	downstream relay has cleared the fault for each relay pair, by drawing random
+	relay, CT and fault level errors. A pickup error scales every pickup of the
+	relay together and so is applied as a scaling of the current the relay sees,
+	the timing error scales the operating time (TMS and delays together). The
+	samples are evaluated in vectorized chunks and the pairs can be shared across
+	worker processes, each pair has its own random stream so the result does not
+	depend on the chunk size or number of processes.
+		Inputs:
+				pairs = list of (upstream, downstream) pairs of overcurrent.Relay objects
+					or single stages
+				Ifault = the nominal fault current seen by the downstream relay, a scalar
+					or one current for each pair
+				samples = number of samples for each pair
+				margin = the time the downstream breaker takes to clear the fault, the
+					pair miscoordinates where the upstream time is less than the
+					downstream time plus the margin
+				share = the ratio of the current seen by the upstream relay to the
+					current seen by the downstream relay, a scalar or one for each pair
+				pickuptol = relative pickup error of the relays
+				timetol = relative operating time error of the relays
+				cttol = relative CT ratio error
+				faulttol = relative error of the fault level
+				distribution = uniform where the tolerances are the limits of a uniform
+					distribution or normal where the tolerances are standard deviations
+				confidence = the confidence level of the interval
+				chunksize = number of samples evaluated together
+				processes = number of worker processes, 1 runs in this process and None
+					uses the number of CPUs
+				seed = seed for the random number generator
+		Output is a structured array with a record for each pair containing the
+		names of the relays, the number of samples and failures, the probability of
+		miscoordination and the lower and upper limits of the confidence interval.
+		Samples where the downstream relay does not operate are not failures.
+	"""
+	if distribution not in ('uniform', 'normal'):
+		raise ValueError('distribution must be uniform or normal')
+	P = len(pairs)
+	Ifault = np.broadcast_to(np.asarray(Ifault, dtype=float), (P,))
+	share = np.broadcast_to(np.asarray(share, dtype=float), (P,))
+	tolerances = (pickuptol, timetol, cttol, faulttol, distribution)
+	streams = np.random.SeedSequence(seed).spawn(P)
+	jobs = [
+		(pair, Ifault[k], share[k], samples, margin, tolerances, chunksize,
+			streams[k])
+		for k, pair in enumerate(pairs)
+		]
+	if processes == 1:
+		failures = [_misscount(job) for job in jobs]
+	else:
+		with ProcessPoolExecutor(max_workers=processes) as pool:
+			failures = list(pool.map(_misscount, jobs))
+
+	failures = np.array(failures, dtype=np.int64)
+	lower, upper = wilson(failures, samples, confidence)
+	result = np.zeros(P, dtype=[
+		('Upstream', 'U32'),
+		('Downstream', 'U32'),
+		('Samples', np.int64),
+		('Failures', np.int64),
+		('Probability', float),
+		('Lower', float),
+		('Upper', float)
+		])
+	result['Upstream'] = [_devicename(pair[0], k) for k, pair in enumerate(pairs)]
+	result['Downstream'] = [_devicename(pair[1], k) for k, pair in enumerate(pairs)]
+	result['Samples'] = samples
+	result['Failures'] = failures
+	result['Probability'] = failures / samples
+	result['Lower'] = lower
+	result['Upper'] = upper
+	return result
+
+
+def _misscount(job):
+	"""counts the miscoordinated samples for one pair, this is called in the
+	worker processes of miscoordination"""
+	pair, Ifault, share, samples, margin, tolerances, chunksize, stream = job
+	upstream, downstream = pair
+	pickuptol, timetol, cttol, faulttol, distribution = tolerances
+	# columns are fault, upstream CT, pickup and time, downstream CT, pickup and
+	# time
+	tol = np.array(
+		[faulttol, cttol, pickuptol, timetol, cttol, pickuptol, timetol]
+		)
+	rng = np.random.default_rng(stream)
+	failures = 0
+	for start in range(0, samples, chunksize):
+		n = min(chunksize, samples - start)
+		scale = 1 + _errors(rng, (n, 7), tol, distribution)
+		I = Ifault * scale[:, 0]
+		down = _devicetime(downstream, I * scale[:, 4] / scale[:, 5])
+		down = down * scale[:, 6]
+		up = _devicetime(
+			upstream, share * I * scale[:, 1] / scale[:, 2], upstream=True
+			) * scale[:, 3]
+		with np.errstate(invalid='ignore'):
+			missed = np.isfinite(down) & (up < down + margin)
+		failures += int(np.count_nonzero(missed))
+	return failures
+
+
+def stability(devices, currents, samples=10**6, cttol=0.03, phasetol=3,
+		measuretol=0.02, faulttol=0.1, distribution='uniform', confidence=0.95,
+		chunksize=2**18, processes=1, seed=None):
+	"""Estimates the probability that a differential characteristic operates for
+	an external fault by drawing random CT ratio and phase errors, relay
+	measurement errors and fault current errors at each end of the line. The
+	samples are evaluated with the vectorized trip mask in chunks so the memory
+	used does not depend on the number of samples, and the devices can be shared
+	across worker processes. Each device and fault level has its own random
+	stream so the result does not depend on the chunk size or number of
+	processes.
+		Inputs:
+				devices = list of differential characteristics, for example P543()
+				currents = the through fault currents in per unit
+				samples = number of samples for each device and current
+				cttol = relative CT ratio error
+				phasetol = CT phase error in degrees
+				measuretol = relative measurement error of the relay
+				faulttol = relative error of the fault current
+				distribution = uniform where the tolerances are the limits of a uniform
+					distribution or normal where the tolerances are standard deviations
+				confidence = the confidence level of the interval
+				chunksize = number of samples evaluated together
+				processes = number of worker processes, 1 runs in this process and None
+					uses the number of CPUs
+				seed = seed for the random number generator
+		Output is a structured array with a record for each device and current
+		containing the device name, the current, the number of samples and
+		maloperations, the probability of maloperation and the lower and upper
+		limits of the confidence interval
+	"""
+	if distribution not in ('uniform', 'normal'):
+		raise ValueError('distribution must be uniform or normal')
+	currents = np.atleast_1d(np.asarray(currents, dtype=float))
+	tolerances = (cttol, phasetol, measuretol, faulttol, distribution)
+	streams = np.random.SeedSequence(seed).spawn(len(devices))
+	jobs = [
+		(device, currents, samples, tolerances, chunksize, streams[k])
+		for k, device in enumerate(devices)
+		]
+	if processes == 1:
+		failures = [_tripcount(job) for job in jobs]
+	else:
+		with ProcessPoolExecutor(max_workers=processes) as pool:
+			failures = list(pool.map(_tripcount, jobs))
+
+	failures = np.array(failures, dtype=np.int64).ravel()
+	lower, upper = wilson(failures, samples, confidence)
+	result = np.zeros(len(devices) * currents.size, dtype=[
+		('Device', 'U32'),
+		('Current', float),
+		('Samples', np.int64),
+		('Failures', np.int64),
+		('Probability', float),
+		('Lower', float),
+		('Upper', float)
+		])
+	result['Device'] = np.repeat(
+		[type(device).__name__ for device in devices], currents.size
+		)
+	result['Current'] = np.tile(currents, len(devices))
+	result['Samples'] = samples
+	result['Failures'] = failures
+	result['Probability'] = failures / samples
+	result['Lower'] = lower
+	result['Upper'] = upper
+	return result
+
+
+def _tripcount(job):
+	"""counts the maloperations of one device at each current, this is called in
+	the worker processes of stability"""
+	device, currents, samples, tolerances, chunksize, stream = job
+	cttol, phasetol, measuretol, faulttol, distribution = tolerances
+	# columns are fault, local CT ratio, phase and measurement, remote CT ratio,
+	# phase and measurement
+	tol = np.array(
+		[faulttol, cttol, phasetol, measuretol, cttol, phasetol, measuretol]
+		)
+	failures = []
+	for current, substream in zip(currents, stream.spawn(currents.size)):
+		rng = np.random.default_rng(substream)
+		count = 0
+		for start in range(0, samples, chunksize):
+			n = min(chunksize, samples - start)
+			error = _errors(rng, (n, 7), tol, distribution)
+			I = current * (1 + error[:, 0])
+			Iloc = (
+				I * (1 + error[:, 1]) * (1 + error[:, 3]) *
+				np.exp(1j * np.radians(error[:, 2]))
+				)
+			Irem = (
+				- I * (1 + error[:, 4]) * (1 + error[:, 6]) *
+				np.exp(1j * np.radians(error[:, 5]))
+				)
+			count += int(np.count_nonzero(device.tripmask(Iloc, Irem)[0]))
+		failures.append(count)
+	return failures
+
+
+def _errors(rng, shape, tol, distribution):
+	"""draws errors with the tolerances tol on the last axis"""
+	if distribution == 'uniform':
+		return rng.uniform(-1, 1, shape) * tol
+	return rng.standard_normal(shape) * tol
+
+
+def _devicetime(device, I, upstream=False):
+	"""returns the operating times of a Relay or a single stage"""
+	if hasattr(device, 'getoptime'):
+		return device.getoptime(I, upstream)
+	if upstream and hasattr(device, 'upstreamtime'):
+		return device.upstreamtime(I)
+	return device.optime(I)
+
+
+def _devicename(device, k):
+	"""returns the name of a Relay or a name for a single stage"""
+	name = getattr(device, 'relayname', '') or getattr(device, 'name', '')
+	return name or str(k + 1)
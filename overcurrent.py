@@ -1,4 +1,107 @@
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+
+class Curve:
+	"""An inverse time curve in the standard form used by IEC 60255 and IEEE
+	C37.112, t = tms * (A / (M**p - 1) + B) where M is the multiple of pickup.
+	The IEC curves have B = 0. Where tr is given the curve has the inverse reset
+	characteristic t = tms * tr / (1 - M**2) for M < 1.
+	"""
+
+	def __init__(self, A, p, B=0, name='', tr=None):
+		self.A = A
+		self.p = p
+		self.B = B
+		self.name = name
+		self.tr = tr
+		self._invp = 1 / p
+
+	def time(self, M):
+		"""return the operating time at a TMS of 1 for a multiple of pickup or an
+		array of multiples greater than 1"""
+		return self.A / (M**self.p - 1) + self.B
+
+	def multiple(self, t):
+		"""return the multiple of pickup that gives the time t at a TMS of 1, this
+		is the inverse of time. Where t can not be reached the value is inf"""
+		with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+			M = (self.A / (t - self.B) + 1)**self._invp
+		return np.where(t > self.B, M, np.inf)
+
+
+class RICurve(Curve):
+	"""The RI inverse curve, t = tms / (0.339 - 0.236 / M)"""
+
+	def __init__(self, k1=0.339, k2=0.236, name='RI'):
+		self.k1 = k1
+		self.k2 = k2
+		self.name = name
+		self.tr = None
+
+	def time(self, M):
+		return 1 / (self.k1 - self.k2 / M)
+
+	def multiple(self, t):
+		with np.errstate(divide='ignore', invalid='ignore'):
+			M = self.k2 / (self.k1 - 1 / t)
+		return np.where(t > 1 / self.k1, np.maximum(M, 1), np.inf)
+
+
+CURVES = {}
+
+
+def register_curve(name, curve):
+	"""Adds a curve to the registry so that it can be selected by name when an
+	Idmt stage is created. The name is not case sensitive.
+		Inputs:
+				name = the name used to select the curve
+				curve = a Curve instance or an object with time and multiple methods
+	"""
+	CURVES[name.upper()] = curve
+
+
+for _names, _curve in [
+		(['SI', 'IEC S Inverse'], Curve(0.14, 0.02, name='IEC S Inverse')),
+		(['VI', 'IEC V Inverse'], Curve(13.5, 1, name='IEC V Inverse')),
+		(['EI', 'IEC E Inverse'], Curve(80, 2, name='IEC E Inverse')),
+		(['LTI', 'UK LT Inverse'], Curve(120, 1, name='UK LT Inverse')),
+		(['UK Rectifier'], Curve(45900, 5.6, name='UK Rectifier')),
+		(['RI'], RICurve()),
+		(['IEEE M Inverse'],
+			Curve(0.0515, 0.02, 0.114, name='IEEE M Inverse', tr=4.85)),
+		(['IEEE V Inverse'],
+			Curve(19.61, 2, 0.491, name='IEEE V Inverse', tr=21.6)),
+		(['IEEE E Inverse'],
+			Curve(28.2, 2, 0.1217, name='IEEE E Inverse', tr=29.1)),
+		(['US Inverse'], Curve(5.95, 2, 0.18, name='US Inverse', tr=5.95)),
+		(['US ST Inverse'],
+			Curve(0.16758, 0.02, 0.11858, name='US ST Inverse', tr=2.261)),
+		]:
+	for _name in _names:
+		register_curve(_name, _curve)
+
+
+def _curvelup(curve):
+	"""returns the curve object for a curve name, a Curve instance or a list in
+	the form [alpha, beta]"""
+	if isinstance(curve, list):
+		return Curve(curve[1], curve[0])
+	if isinstance(curve, str):
+		try:
+			return CURVES[curve.upper()]
+		except KeyError:
+			raise ValueError('Please enter a curve from ' + ', '.join(CURVES))
+	if hasattr(curve, 'time') and hasattr(curve, 'multiple'):
+		return curve
+	raise ValueError('select a curve type')
 
 
 class Idmt:
@@ -12,30 +115,162 @@ class Idmt:
 		self.deftime = deftime
 		self.adder = adder
 		self.mintime = mintime
-		if isinstance(curve, type(list())):
-			self.alpha = curve[0]
-			self.beta = curve[1]
-		elif isinstance(curve, type(str())):
-			self.alpha = _curvelup(curve)['alpha']
-			self.beta = _curvelup(curve)['beta']
-		else:
-			return print('select a curve type')
-
+		self.characteristic = _curvelup(curve)
+		self.alpha = getattr(self.characteristic, 'p', None)
+		self.beta = getattr(self.characteristic, 'A', None)
+		self.table = None
 
 	def optime(self, I):
 		"""return the operating time for a given current for the IDMT instance, where
-		the current is less than the pickup the value returned is No Op """
-		if I > self.pickup + 0.000001:
-			return max(
-				self.tms *
-				self.beta /
-				(min((I / self.pickup), self.deftime)**self.alpha - 1) +
-				self.adder, self.mintime
+		the current is less than the pickup the value returned is inf. I can be a
+		scalar or an array of currents, an array of times is returned for an array
+		input. Where the stage has been tabulated the table is used.
+		"""
+		if self.table is not None:
+			return self.table.optime(I)
+		return self._optime(I)
+
+	def _optime(self, I):
+		"""the exact operating time from the curve equation"""
+		I = np.asarray(I, dtype=float)
+		M = np.minimum(I / self.pickup, self.deftime)
+		with np.errstate(divide='ignore', invalid='ignore'):
+			time = np.maximum(
+				self.tms * self.characteristic.time(M) + self.adder, self.mintime
 				)
-		else:
-			return 'No Op'
+		return np.where(I > self.pickup + 0.000001, time, np.inf)[()]
+
+	def opcurrent(self, t):
+		"""return the current required for the IDMT instance to operate within the
+		time t, this is the inverse of optime. Where the time can not be reached,
+		below the mintime or the time at the deftime clamp, the value returned is
+		inf. t can be a scalar or an array of times.
+		"""
+		t = np.asarray(t, dtype=float)
+		with np.errstate(divide='ignore', invalid='ignore'):
+			M = self.characteristic.multiple((t - self.adder) / self.tms)
+		reachable = (
+			(t > self.adder) & (t >= self.mintime) & (M <= self.deftime * (1 + 1e-9))
+			)
+		M = np.minimum(M, self.deftime)
+		return np.where(reachable, self.pickup * M, np.inf)[()]
+
+	def tabulate(self, rtol=1e-4, Mmin=1.01):
+		"""Replaces the curve equation in optime with a lookup table that meets the
+		relative error rtol from Mmin times pickup up to the deftime clamp, below
+		Mmin the curve equation is still used. Set rtol=None to remove the table.
+		The accuracy report of the table is returned.
+		"""
+		if rtol is None:
+			self.table = None
+			return
+		self.table = CurveTable(self, rtol, Mmin)
+		return self.table.report()
 			
 
+class CurveTable:
+	"""A lookup table of operating time against current for an IDMT stage. Each
+	octave of current (2**e to 2**(e + 1)) is split into the same power of two
+	number of equal steps, so the table is log spaced and the table position of a
+	current is read directly from the exponent and leading mantissa bits of the
+	floating point value. The number of steps is increased until linear
+	interpolation is within the relative error rtol of the curve equation, a
+	ValueError is raised where rtol can not be met with 2**20 steps per octave.
+	Evaluation is a bit shift, a lookup and a multiply-add, no powers or
+	logarithms are calculated.
+	"""
+
+	def __init__(self, stage, rtol=1e-4, Mmin=1.01):
+		self.stage = stage
+		self.rtol = rtol
+		self.Mmin = Mmin
+		self.high = stage.pickup * stage.deftime
+		first = np.frexp(stage.pickup * Mmin)[1] - 1
+		# one octave more than needed so that the last interval is flat
+		last = np.frexp(self.high)[1] + 1
+
+		bits = 4
+		while True:
+			steps = 2**bits
+			mantissa = 1 + np.arange(steps) / steps
+			currents = np.ldexp(mantissa[None, :], np.arange(first, last)[:, None])
+			currents = np.append(currents.ravel(), np.ldexp(1.0, last))
+			start = np.searchsorted(currents, stage.pickup * Mmin) - 1
+			times = stage._optime(currents)
+			error = self._error(currents[start + 1:], times[start + 1:])
+			if error <= rtol / 2 or bits >= 20:
+				break
+			# the interpolation error falls with the square of the step
+			bits += max(1, int(np.ceil(np.log2(np.sqrt(2 * error / rtol) * 1.1))))
+			bits = min(bits, 20)
+		if error > rtol / 2:
+			raise ValueError(
+				'rtol={} can not be met with 2**20 steps per octave, the error is '
+				'{:.3g}, use a larger rtol or Mmin'.format(rtol, error)
+				)
+		self.shift = 52 - bits
+		self.base = np.array(currents[0]).view(np.int64) >> self.shift
+		self.start = start + 1
+		self.low = currents[start + 1]
+		self.currents = currents
+		self.times = times
+		# the intervals below start are never looked up and their times are inf
+		# at and below pickup
+		self.slopes = np.zeros(len(currents) - 1)
+		self.intercepts = np.zeros(len(currents) - 1)
+		I, t = currents[self.start:], times[self.start:]
+		slopes = np.diff(t) / np.diff(I)
+		self.slopes[self.start:] = slopes
+		self.intercepts[self.start:] = t[:-1] - slopes * I[:-1]
+
+	def _error(self, currents, times):
+		"""the largest relative interpolation error at points in each interval"""
+		step = np.diff(currents)
+		fractions = np.array([0.25, 0.5, 0.75])
+		I = currents[:-1, None] + step[:, None] * fractions
+		slope = (np.diff(times) / step)[:, None]
+		guess = times[:-1, None] + slope * (I - currents[:-1, None])
+		exact = self.stage._optime(I)
+		return np.max(np.abs(guess - exact) / exact)
+
+	def optime(self, I):
+		"""return the operating time from the table for a current or an array of
+		currents"""
+		I = np.asarray(I, dtype=float)
+		shape = I.shape
+		I = I.ravel()
+		flat = np.minimum(I, self.currents[-1])
+		k = (flat.view(np.int64) >> self.shift) - self.base
+		np.clip(k, self.start, len(self.slopes) - 1, out=k)
+		time = np.take(self.intercepts, k)
+		time += np.take(self.slopes, k) * flat
+		below = ~(I >= self.low)
+		if below.any():
+			time[below] = self.stage._optime(I[below])
+		return time.reshape(shape)[()]
+
+	def report(self, points=100000, seed=0):
+		"""Compares the table with the curve equation at random log spaced currents
+		across the table range. Output is a dictionary that contains the requested
+		relative error, the number of table currents, the table range and the
+		maximum and mean relative error found.
+		"""
+		rng = np.random.default_rng(seed)
+		I = np.exp(rng.uniform(np.log(self.low), np.log(self.high), points))
+		inside = (self.currents >= self.low) & (self.currents < self.high)
+		I = np.concatenate((I, self.currents[inside] * (1 + 2.0**(self.shift - 53))))
+		I = I[I < self.high]
+		exact = self.stage._optime(I)
+		error = np.abs(self.optime(I) - exact) / exact
+		return {
+			'rtol': self.rtol,
+			'Points': len(self.currents),
+			'Range': [float(self.low), self.high],
+			'MaxError': float(np.max(error)),
+			'MeanError': float(np.mean(error))
+			}
+
+
 class Deftime:
 
 	def __init__(self, pickup, delay=0.01):
@@ -44,12 +279,263 @@ class Deftime:
 		self.delay = delay
 
 	def optime(self, I):
-		"""return the operating time for a given current for the IDMT instance, where
-		the current is less than the pickup the value returned is No Op """
-		if I > self.pickup:
-			return self.delay
-		else:
-			return 'No Op'
+		"""return the operating time for a given current for the definite time
+		instance, where the current is less than the pickup the value returned is
+		inf. I can be a scalar or an array of currents.
+		"""
+		I = np.asarray(I, dtype=float)
+		return np.where(I > self.pickup, float(self.delay), np.inf)[()]
+
+	def opcurrent(self, t):
+		"""return the current required for the definite time instance to operate
+		within the time t, where t is less than the delay the value returned is inf
+		"""
+		t = np.asarray(t, dtype=float)
+		return np.where(t >= self.delay, float(self.pickup), np.inf)[()]
+
+
+def _loginterp(x, xp, fp):
+	"""log-log interpolation of fp against xp, xp must be increasing"""
+	with np.errstate(divide='ignore', invalid='ignore'):
+		return np.exp(np.interp(np.log(x), np.log(xp), np.log(fp)))
+
+
+class Tabulated:
+	"""A time-current curve given as a table of points, for example a vendor fuse
+	or recloser curve. The operating time is interpolated on log-log axes, below
+	the first current the value returned is inf and above the last current the
+	last time is used. The curve operates at the first current, so the stage is
+	inclusive of its pickup.
+	"""
+
+	def __init__(self, currents, times):
+		self.element_type = 'TAB'
+		self.inclusive = True
+		order = np.argsort(currents)
+		self.currents = np.asarray(currents, dtype=float)[order]
+		self.times = np.asarray(times, dtype=float)[order]
+		self.pickup = self.currents[0]
+
+	def optime(self, I):
+		"""return the operating time for a current or an array of currents"""
+		I = np.asarray(I, dtype=float)
+		time = _loginterp(I, self.currents, self.times)
+		return np.where(I >= self.pickup, time, np.inf)[()]
+
+	def opcurrent(self, t):
+		"""return the current required to operate within the time t"""
+		t = np.asarray(t, dtype=float)
+		current = _loginterp(t, self.times[::-1], self.currents[::-1])
+		return np.where(t >= self.times.min(), current, np.inf)[()]
+
+
+class Fuse:
+	"""A fuse defined by its minimum melt and total clear curves, each given as
+	[currents, times]. Where no clear curve is given the melt curve is used. In
+	a Relay the fuse operates on its clear curve, as an upstream device in a
+	grading check the melt curve is used as the fuse must not melt.
+	"""
+
+	def __init__(self, melt, clear=None, name=''):
+		self.element_type = 'FUSE'
+		self.name = name
+		self.melt = Tabulated(*melt)
+		self.clear = Tabulated(*clear) if clear is not None else self.melt
+		self.pickup = self.melt.pickup
+		self.inclusive = True
+
+	def melttime(self, I):
+		return self.melt.optime(I)
+
+	def cleartime(self, I):
+		return self.clear.optime(I)
+
+	def optime(self, I):
+		return self.clear.optime(I)
+
+	def upstreamtime(self, I):
+		return self.melt.optime(I)
+
+	def opcurrent(self, t):
+		return self.clear.opcurrent(t)
+
+
+class Recloser:
+	"""A recloser with fast and slow curves, each an Idmt, Deftime or Tabulated
+	stage, and the number of trips on each curve before lockout. In a Relay the
+	recloser time is the total tripping time of all the shots, which is the duty
+	seen by an upstream device. As an upstream device in a grading check the slow
+	curve is used as it must allow a downstream fuse to clear.
+	"""
+
+	def __init__(self, fast, slow, shots=(1, 2), name=''):
+		self.element_type = 'RECLOSER'
+		self.name = name
+		self.fast = fast
+		self.slow = slow
+		self.shots = shots
+		self.pickup = min(fast.pickup, slow.pickup)
+		self.inclusive = any(
+			getattr(curve, 'inclusive', False) for curve in (fast, slow)
+			)
+
+	def fasttime(self, I):
+		return self.fast.optime(I)
+
+	def slowtime(self, I):
+		return self.slow.optime(I)
+
+	def optime(self, I):
+		"""return the total tripping time of all the shots to lockout, each fast
+		shot is timed by the slow curve where it is faster or the fast curve does
+		not operate"""
+		fast, slow = self.shots
+		I = np.asarray(I, dtype=float)
+		slowtime = self.slow.optime(I)
+		time = np.zeros(I.shape)
+		if fast:
+			time = time + fast * np.minimum(self.fast.optime(I), slowtime)
+		if slow:
+			time = time + slow * slowtime
+		return time[()]
+
+	def upstreamtime(self, I):
+		return self.slow.optime(I)
+
+	def opcurrent(self, t):
+		"""return the current required for the recloser to lock out within the
+		time t"""
+		t = np.asarray(t, dtype=float)
+		low = np.full(t.shape, float(self.pickup))
+		high = np.full(t.shape, 1e9)
+		for n in range(60):
+			mid = np.sqrt(low * high)
+			operates = self.optime(mid) <= t
+			high = np.where(operates, mid, high)
+			low = np.where(operates, low, mid)
+		return np.where(self.optime(high) <= t, high, np.inf)[()]
+
+	def saving(self, fuse, I):
+		"""returns the fuse saving margin, the fuse melt time less the fast curve
+		time, for a current or an array of currents. The margin must be positive
+		for the fast curve to clear a transient fault before the fuse melts.
+		"""
+		return fuse.melttime(I) - self.fast.optime(I)
+
+
+def loadcurve(filename):
+	"""Reads a vendor time-current table from a text or csv file. Each row holds
+	a current followed by one or more times, rows that do not start with numbers
+	(headers and comments) are skipped. Output is a list of arrays, the currents
+	followed by each column of times.
+	"""
+	rows = []
+	with open(filename) as f:
+		for line in f:
+			fields = line.replace(',', ' ').replace(';', ' ').split()
+			try:
+				rows.append([float(field) for field in fields])
+			except ValueError:
+				continue
+	rows = np.array([row for row in rows if len(row) >= 2])
+	return [rows[:, k] for k in range(rows.shape[1])]
+
+
+def loadfuse(meltfile, clearfile=None, name=''):
+	"""Creates a Fuse from vendor curve tables. The melt file holds current and
+	melt time, or current, melt time and clear time. A separate clear file can be
+	given in the same form as the melt file.
+	"""
+	table = loadcurve(meltfile)
+	melt = table[:2]
+	clear = None
+	if clearfile is not None:
+		clear = loadcurve(clearfile)[:2]
+	elif len(table) > 2:
+		clear = [table[0], table[2]]
+	return Fuse(melt, clear, name)
+
+
+class Envelope:
+	"""A compiled time-current envelope for a group of stages. The current axis is
+	split at every stage pickup and every IDMT deftime clamp so that within each
+	segment the set of operating stages is fixed. Stages that are flat within a
+	segment (definite time stages and clamped IDMT stages) are reduced to a single
+	time per segment, only the unclamped IDMT stages are evaluated per current.
+	A stage operates above its pickup, or at and above it where the stage is
+	inclusive (tabulated curves).
+	"""
+
+	def __init__(self, stages):
+		self.stages = list(stages)
+		thresholds = []
+		clamps = []
+		for stage in self.stages:
+			if stage.element_type == 'IDMT':
+				thresholds.append(stage.pickup + 0.000001)
+				clamps.append(stage.pickup * stage.deftime)
+			elif getattr(stage, 'inclusive', False):
+				# the segment that ends at the pickup holds only the pickup
+				thresholds.append(np.nextafter(stage.pickup, -np.inf))
+				clamps.append(np.inf)
+			else:
+				thresholds.append(stage.pickup)
+				clamps.append(np.inf)
+		thresholds = np.array(thresholds, dtype=float)
+		clamps = np.array(clamps, dtype=float)
+		self.breakpoints = np.unique(np.concatenate((thresholds, clamps)))
+		self.breakpoints = self.breakpoints[np.isfinite(self.breakpoints)]
+
+		# segment i covers breakpoints[i - 1] < I <= breakpoints[i]
+		lower = np.concatenate(([-np.inf], self.breakpoints))
+		active = thresholds[:, None] <= lower[None, :]
+		fixed = np.array(
+			[stage.element_type == 'DT' for stage in self.stages], dtype=bool
+			)
+		flat = active & (fixed[:, None] | (clamps[:, None] <= lower[None, :]))
+		live = active & ~flat
+
+		self.floor = np.full(lower.shape, np.inf)
+		for stage, mask in zip(self.stages, flat):
+			self.floor[mask] = np.minimum(self.floor[mask], stage.optime(np.inf))
+		self.live = [
+			(stage, mask) for stage, mask in zip(self.stages, live) if mask.any()
+			]
+
+	def optime(self, I, upstream=False):
+		"""return the minimum operating time over all stages for a current or an
+		array of currents, where no stage operates (or the current is nan) the value
+		returned is inf. Set upstream to use the upstream times of fuses and
+		reclosers.
+		"""
+		I = np.asarray(I, dtype=float)
+		shape = I.shape
+		I = I.ravel()
+		segment = np.searchsorted(self.breakpoints, I)
+		time = self.floor[segment]
+		for stage, mask in self.live:
+			sel = mask[segment]
+			if sel.any():
+				if upstream and hasattr(stage, 'upstreamtime'):
+					stagetime = stage.upstreamtime(I[sel])
+				else:
+					stagetime = stage.optime(I[sel])
+				time[sel] = np.minimum(time[sel], stagetime)
+		# searchsorted puts a nan current in the last segment, no stage operates
+		time[np.isnan(I)] = np.inf
+		return time.reshape(shape)[()]
+
+	def opcurrent(self, t):
+		"""return the smallest current at which the envelope operates within the
+		time t for a time or an array of times. Each stage time is non-increasing
+		with current so this is the smallest of the stage inverses, where no stage
+		can operate within the time the value returned is inf.
+		"""
+		t = np.asarray(t, dtype=float)
+		current = np.full(t.shape, np.inf)
+		for stage in self.stages:
+			current = np.minimum(current, stage.opcurrent(t))
+		return current[()]
 
 
 class Relay:
@@ -57,38 +543,167 @@ class Relay:
 	def __init__(self, relayname=''):
 		self.stages = []
 		self.relayname = relayname
+		self._envelope = None
 		return
 	
 	def add_element(self, stage):
 		self.stages.append(stage)
 		self.stages.sort(key=lambda x : x.pickup)
+		self._envelope = None
 	
 	def add_fault_range(self, minfault, maxfault):
 		self.min = minfault
 		self.max = maxfault
+
+	@property
+	def envelope(self):
+		"""The compiled envelope of the relay stages, this is rebuilt the first time
+		it is used after add_element changes the stage list
+		"""
+		if self._envelope is None:
+			self._envelope = Envelope(self.stages)
+		return self._envelope
 	
-	def getoptime(self, I):
-		operatetime = 1000000
-		for stage in self.stages:		
-			try:
-				if stage.optime(I) < operatetime:
-						operatetime = stage.optime(I)
-			except:
-				pass
-		return operatetime
+	def getoptime(self, I, upstream=False):
+		"""return the operating time of the fastest stage for a current or an array
+		of currents, where no stage operates the value returned is inf. Set
+		upstream for the times used when the relay is the upstream device, fuses
+		then use the melt curve and reclosers the slow curve.
+		"""
+		return self.envelope.optime(I, upstream)
+
+	def tabulate(self, rtol=1e-4, Mmin=1.01):
+		"""Tabulates every IDMT stage of the relay, see Idmt.tabulate. Set
+		rtol=None to go back to the curve equations. A list containing the accuracy
+		report of each table is returned.
+		"""
+		self._envelope = None
+		return [
+			stage.tabulate(rtol, Mmin) for stage in self.stages
+			if stage.element_type == 'IDMT'
+			]
+
+	def getopcurrent(self, t):
+		"""return the current required for the relay to operate within the time t
+		for a time or an array of times, where the relay can not operate within the
+		time the value returned is inf
+		"""
+		return self.envelope.opcurrent(t)
 	
-	def plotchar(self):
-		try:
-			Ifault = list(self.min, self.max, 10)
-		except:
-			Ifault = list(range(10, 100000, 10))
-			time = []
-			for i in Ifault:
-				time.append(self.getoptime(i))
-		return Ifault, time, self.relayname, 
-				
-		
+	def sample(self, Imin=None, Imax=None, tol=0.005, maxdepth=30):
+		"""Samples the time-current characteristic of the relay with the fewest
+		points needed to draw it, the currents are log spaced and straight lines
+		between the points on log-log axes are within the relative time tolerance
+		tol of the characteristic. Every stage breakpoint in the range is included
+		with a second point just above it so that steps are drawn square, and the
+		currents where two stage curves cross are included so that corners are
+		sharp. A tolerance of 0.01 is about one pixel on a sheet of 200 pixels per decade.
+			Inputs:
+					Imin, Imax = the current range, by default the fault range set with
+						add_fault_range or half the lowest breakpoint to ten times the
+						highest breakpoint
+					tol = relative time tolerance
+					maxdepth = the maximum number of times an interval is halved
+			Output is the arrays of currents and operating times, inf where the relay
+			does not operate
+		"""
+		edges = self.envelope.breakpoints
+		if Imin is None:
+			Imin = getattr(self, 'min', edges.min() / 2 if edges.size else 1)
+		if Imax is None:
+			Imax = getattr(self, 'max', edges.max() * 10 if edges.size else 100000)
+		edges = edges[(edges > Imin) & (edges < Imax)]
+		decades = max(int(np.ceil(np.log10(Imax / Imin) * 4)), 1)
+		current = np.unique(np.concatenate((
+			np.geomspace(Imin, Imax, decades + 1), edges, edges * (1 + 1e-9)
+			)))
+		current = np.union1d(current, self._crossings(current))
+		time = self.getoptime(current)
+
+		currents = [current]
+		times = [time]
+		logtol = np.log1p(tol)
+		# the error is checked at the quarter points of each interval so that a
+		# corner between stages close to one end is not missed
+		fractions = np.array([0.25, 0.5, 0.75])
+		lo, hi, tlo, thi = current[:-1], current[1:], time[:-1], time[1:]
+		for depth in range(maxdepth):
+			keep = hi > lo * (1 + 1e-6)
+			lo, hi, tlo, thi = lo[keep], hi[keep], tlo[keep], thi[keep]
+			if lo.size == 0:
+				break
+			points = lo[:, None] * (hi / lo)[:, None]**fractions
+			exact = self.getoptime(points)
+			with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+				predicted = np.where(
+					np.isinf(tlo * thi)[:, None], np.inf,
+					tlo[:, None] * (thi / tlo)[:, None]**fractions
+					)
+				error = np.abs(np.log(exact / predicted))
+			split = ((exact != predicted) & ~(error <= logtol)).any(axis=1)
+			lo, hi, tlo, thi = lo[split], hi[split], tlo[split], thi[split]
+			mid, tmid = points[split, 1], exact[split, 1]
+			currents.append(mid)
+			times.append(tmid)
+			lo, hi = np.concatenate((lo, mid)), np.concatenate((mid, hi))
+			tlo, thi = np.concatenate((tlo, tmid)), np.concatenate((tmid, thi))
 
+		current = np.concatenate(currents)
+		order = np.argsort(current)
+		return current[order], np.concatenate(times)[order]
+
+	def _crossings(self, current, iterations=60):
+		"""returns the currents between the points in current where the fastest
+		stage changes without a breakpoint, that is where two stage curves cross.
+		The crossing is a corner of the characteristic and is found by bisection."""
+		if len(self.stages) < 2:
+			return np.zeros(0)
+		times = np.array([stage.optime(current) for stage in self.stages])
+		fastest = np.argmin(times, axis=0)
+		finite = np.isfinite(times.min(axis=0))
+		change = (
+			(fastest[:-1] != fastest[1:]) & finite[:-1] & finite[1:] &
+			(current[1:] > current[:-1] * (1 + 1e-6))
+			)
+		lo, hi = current[:-1][change], current[1:][change]
+		first = fastest[:-1][change]
+		for n in range(iterations):
+			mid = np.sqrt(lo * hi)
+			same = np.argmin(
+				[stage.optime(mid) for stage in self.stages], axis=0
+				) == first
+			lo, hi = np.where(same, mid, lo), np.where(same, hi, mid)
+		return np.sqrt(lo * hi)
+
+	def export(self, filename, Imin=None, Imax=None, tol=0.005):
+		"""Writes the sampled time-current characteristic of the relay to a csv or
+		json file, the format is chosen by the file extension. Times where the relay
+		does not operate are written as inf in csv files and null in json files.
+		See sample for the inputs.
+		"""
+		current, time = self.sample(Imin, Imax, tol)
+		if filename.lower().endswith('.json'):
+			data = {
+				'relay': self.relayname,
+				'current': current.tolist(),
+				'time': [t if np.isfinite(t) else None for t in time.tolist()]
+				}
+			with open(filename, 'w') as f:
+				json.dump(data, f, indent=1)
+		elif filename.lower().endswith('.csv'):
+			with open(filename, 'w', newline='') as f:
+				writer = csv.writer(f)
+				writer.writerow(['Current', 'Time'])
+				writer.writerows(zip(current.tolist(), time.tolist()))
+		else:
+			raise ValueError('filename must end in .csv or .json')
+		return filename
+
+	def plotchar(self):
+		"""returns the sampled currents and times of the characteristic over the
+		fault range set with add_fault_range and the relay name"""
+		Ifault, time = self.sample()
+		return Ifault, time, self.relayname
 
 
 class Pltidmt:
@@ -101,53 +716,444 @@ class Pltidmt:
 	def add_relay(self, relay):
 		self.relays.append(relay)
 		return
+
+	def coordinate(self, Ifault, margin=0.3, pairs=None):
+		"""Calculates the grading margin between every pair of relays in the group.
+		The margin[i, j, f] is the operating time of relay i (upstream) less the
+		operating time of relay j (downstream) at fault current f. The upstream
+		times of fuses and reclosers are used for relay i, see Relay.getoptime.
+			Inputs:
+					Ifault = fault currents, either a vector of F currents seen by every
+						relay or an array that broadcasts to N x N x F giving the current
+						for each upstream/downstream pair
+					margin = the required grading margin in seconds
+					pairs = optional N x N boolean array of the upstream/downstream pairs
+						to be checked, by default every pair except a relay with itself
+			Output is a dictionary that contains the N x N x F margin array and the
+			flags array that is True where the downstream relay operates and the
+			margin is less than required
+		"""
+		N = len(self.relays)
+		Ifault = np.asarray(Ifault, dtype=float)
+		if Ifault.ndim <= 1:
+			times = np.array([relay.getoptime(Ifault) for relay in self.relays])
+			uptimes = np.array(
+				[relay.getoptime(Ifault, upstream=True) for relay in self.relays]
+				)
+			upstream = uptimes.reshape(N, -1)[:, None, :]
+			downstream = times.reshape(N, -1)[None, :, :]
+		else:
+			Ifault = np.broadcast_to(Ifault, (N, N, Ifault.shape[-1]))
+			upstream = np.stack([
+				relay.getoptime(Ifault[i], upstream=True)
+				for i, relay in enumerate(self.relays)
+				])
+			downstream = np.stack(
+				[relay.getoptime(Ifault[:, j]) for j, relay in enumerate(self.relays)],
+				axis=1
+				)
+		with np.errstate(invalid='ignore'):
+			gap = upstream - downstream
+			flags = (gap < margin) & np.isfinite(downstream)
+		if pairs is None:
+			pairs = ~np.eye(N, dtype=bool)
+		flags = flags & np.asarray(pairs, dtype=bool)[:, :, None]
+		return {'margin': gap, 'flags': flags}
 	
 
-def _curvelup(curve):
-	curves = {
-		'SI': {'alpha': 0.02, 'beta': 0.14},
-		'VI': {'alpha': 1, 'beta': 13.5},
-		'EI': {'alpha': 2, 'beta': 80}
-		}
-	for k, v in curves.items():
-		if curve.upper() == k:
-			return v
+def gradechain(chain, faults=None, margin=0.3, tmsstep=0.01, tmsmin=0.025,
+		points=50):
+	"""Grades a radial chain of relays by setting the smallest TMS on each IDMT
+	stage that gives the required margin over the downstream element, the
+	pickups are not changed. The chain is ordered from the load end to the
+	source and is graded in that order, the first element is left at its current
+	setting.
+		Inputs:
+				chain = list of Relay objects or Idmt stages, for a Relay the lowest
+					pickup IDMT stage is graded
+				faults = list of [minfault, maxfault] for each element, where not given
+					the range set with Relay.add_fault_range is used, so faults is
+					needed for a chain of Idmt stages
+				margin = required grading margin in seconds
+				tmsstep = TMS setting step, the TMS is rounded up to this step
+				tmsmin = minimum TMS setting
+				points = number of log spaced currents used across each fault range
+		Output is a list containing a dictionary for each element with the TMS set
+		and the minimum margin achieved over the downstream fault range
+	"""
+	if faults is None:
+		faults = []
+		for k, element in enumerate(chain[:-1]):
+			if not hasattr(element, 'min') or not hasattr(element, 'max'):
+				raise ValueError(
+					'Element {} has no fault range, pass faults or use '
+					'Relay.add_fault_range'.format(k + 1)
+					)
+			faults.append([element.min, element.max])
+	if len(faults) < len(chain) - 1:
+		raise ValueError('faults needs a [minfault, maxfault] for each element')
+	results = [{'TMS': _gradestage(chain[0]).tms, 'Margin': np.nan}]
+	for k in range(1, len(chain)):
+		downstream = chain[k - 1]
+		stage = _gradestage(chain[k])
+		minfault, maxfault = faults[k - 1]
+		I = np.geomspace(minfault, maxfault, points)
+		if isinstance(downstream, Relay):
+			edges = downstream.envelope.breakpoints
+			edges = edges[(edges >= minfault) & (edges <= maxfault)]
+			I = np.sort(np.concatenate((I, edges, edges * (1 + 1e-9))))
+		tdown = _elementtime(downstream, I)
+
+		M = np.minimum(I / stage.pickup, stage.deftime)
+		need = (I > stage.pickup + 0.000001) & np.isfinite(tdown)
+		required = tdown + margin
+		need &= required > stage.mintime
+		with np.errstate(divide='ignore', invalid='ignore'):
+			tms = (required - stage.adder) / stage.characteristic.time(M)
+		tms = np.max(tms[need], initial=tmsmin)
+		tms = np.ceil(max(tms, tmsmin) / tmsstep - 1e-9) * tmsstep
+		stage.tms = float(round(tms, 10))
+		if stage.table is not None:
+			stage.tabulate(stage.table.rtol, stage.table.Mmin)
+		if isinstance(chain[k], Relay):
+			chain[k]._envelope = None
+
+		with np.errstate(invalid='ignore'):
+			gap = _elementtime(chain[k], I) - tdown
+		gap = gap[np.isfinite(tdown)]
+		results.append({
+			'TMS': stage.tms,
+			'Margin': float(np.min(gap)) if gap.size else np.nan
+			})
+	return results
+
+
+def _gradestage(element):
+	"""returns the IDMT stage to be graded for a Relay or an Idmt stage"""
+	if isinstance(element, Relay):
+		for stage in element.stages:
+			if stage.element_type == 'IDMT':
+				return stage
+		raise ValueError('Relay {} has no IDMT stage'.format(element.relayname))
+	return element
+
+
+def _elementtime(element, I):
+	"""returns the operating times for a Relay or a single stage"""
+	if isinstance(element, Relay):
+		return element.getoptime(I)
+	return element.optime(I)
+
+
+def sequence(X):
+	"""returns the zero, positive and negative sequence components of three phase
+	phasors, the phases are on the last axis of X in the order A, B, C"""
+	X = np.asarray(X, dtype=complex)
+	a = np.exp(2j * np.pi / 3)
+	X0 = (X[..., 0] + X[..., 1] + X[..., 2]) / 3
+	X1 = (X[..., 0] + a * X[..., 1] + a**2 * X[..., 2]) / 3
+	X2 = (X[..., 0] + a**2 * X[..., 1] + a * X[..., 2]) / 3
+	return X0, X1, X2
+
+
+def _direction(Iop, Vpol, rca, direction, vmin):
+	"""returns True where the operating current is in the set direction, that is
+	within 90 degrees of the polarising voltage advanced by the characteristic
+	angle rca, and the polarising voltage is above vmin"""
+	torque = np.real(Iop * np.conj(Vpol) * np.exp(-1j * np.radians(rca)))
+	if direction == 'reverse':
+		torque = -torque
+	return (torque > 0) & (np.abs(Vpol) > vmin)
+
+
+class DirPhase:
+	"""Directional phase overcurrent element with quadrature polarising, each
+	phase current is compared with the voltage between the other two phases (Ia
+	with Vbc, Ib with Vca and Ic with Vab).
+		Inputs:
+				stage = the Idmt, Deftime or Relay that times the element
+				rca = relay characteristic angle in degrees, current leading the
+					polarising voltage
+				direction = 'forward' or 'reverse'
+				vmin = minimum polarising voltage
+	"""
+
+	def __init__(self, stage, rca=30, direction='forward', vmin=0):
+		self.element_type = 'DIROC'
+		self.stage = stage
+		self.pickup = stage.pickup if hasattr(stage, 'pickup') else 0
+		self.rca = rca
+		self.direction = direction
+		self.vmin = vmin
+
+	def forward(self, V, I):
+		"""returns the directional decision for each phase for arrays of three
+		phase voltage and current phasors, the phases are on the last axis"""
+		V = np.asarray(V, dtype=complex)
+		Vpol = np.stack(
+			[V[..., 1] - V[..., 2], V[..., 2] - V[..., 0], V[..., 0] - V[..., 1]],
+			axis=-1
+			)
+		return _direction(I, Vpol, self.rca, self.direction, self.vmin)
+
+	def optime(self, V, I):
+		"""returns the operating time of the fastest phase that is in the set
+		direction, inf where the element does not operate"""
+		I = np.asarray(I, dtype=complex)
+		times = np.where(
+			self.forward(V, I), _elementtime(self.stage, np.abs(I)), np.inf
+			)
+		return times.min(axis=-1)[()]
+
+
+class DirEarth:
+	"""Directional earth fault element operating on the residual current 3I0 and
+	polarised by the residual voltage -3V0.
+		Inputs:
+				stage = the Idmt, Deftime or Relay that times the element
+				rca = relay characteristic angle in degrees, -60 is typical for a
+					solidly earthed system
+				direction = 'forward' or 'reverse'
+				vmin = minimum residual voltage
+	"""
+
+	def __init__(self, stage, rca=-60, direction='forward', vmin=0):
+		self.element_type = 'DIREF'
+		self.stage = stage
+		self.pickup = stage.pickup if hasattr(stage, 'pickup') else 0
+		self.rca = rca
+		self.direction = direction
+		self.vmin = vmin
+
+	def forward(self, V, I):
+		"""returns the directional decision for arrays of three phase voltage and
+		current phasors, the phases are on the last axis"""
+		V0 = sequence(V)[0]
+		I0 = sequence(I)[0]
+		return _direction(3 * I0, -3 * V0, self.rca, self.direction, self.vmin)
+
+	def optime(self, V, I):
+		"""returns the operating time, inf where the element does not operate"""
+		I0 = sequence(I)[0]
+		time = _elementtime(self.stage, np.abs(3 * I0))
+		return np.where(self.forward(V, I), time, np.inf)[()]
+
+
+class NegSeq:
+	"""Negative sequence overcurrent element operating on the negative sequence
+	current I2, optionally directional using the polarising voltage -V2.
+		Inputs:
+				stage = the Idmt, Deftime or Relay that times the element, the pickup is
+					in terms of I2
+				rca = relay characteristic angle in degrees for the directional decision
+				direction = None for non-directional, 'forward' or 'reverse'
+				vmin = minimum negative sequence voltage
+	"""
+
+	def __init__(self, stage, rca=-60, direction=None, vmin=0):
+		self.element_type = 'NPS'
+		self.stage = stage
+		self.pickup = stage.pickup if hasattr(stage, 'pickup') else 0
+		self.rca = rca
+		self.direction = direction
+		self.vmin = vmin
+
+	def forward(self, V, I):
+		"""returns the directional decision for arrays of three phase voltage and
+		current phasors, always True when the element is non-directional"""
+		I2 = sequence(I)[2]
+		if self.direction is None:
+			return np.ones(I2.shape, dtype=bool)
+		V2 = sequence(V)[2]
+		return _direction(I2, -V2, self.rca, self.direction, self.vmin)
+
+	def optime(self, V, I):
+		"""returns the operating time, inf where the element does not operate"""
+		I2 = sequence(I)[2]
+		time = _elementtime(self.stage, np.abs(I2))
+		return np.where(self.forward(V, I), time, np.inf)[()]
+
+
+class Integrator:
+	"""Integrates the operating time of a group of relays or stages over a record
+	of current samples, so that the response to a varying current can be found.
+	For each element the trip percentage rises by dt / optime(I) for each sample
+	above pickup and once it reaches 100% the element trips and latches. Below
+	pickup the percentage falls according to the reset characteristic.
+		Inputs:
+				elements = list of Relay objects or stages, one for each current column
+				dt = the sample interval in seconds
+				reset = 'instantaneous', 'definite' or 'inverse'
+				treset = the definite reset time in seconds, this can be a list with a
+					value for each element (see PTOC.tReset)
+	The definite reset holds the percentage while the current is below pickup and
+	resets it to zero once the current has been below pickup for treset, a pickup
+	before then carries on from the held value. The inverse reset uses
+	tms * tr / (1 - M**2) from the curve of the IDMT stage.
+	"""
+
+	def __init__(self, elements, dt, reset='instantaneous', treset=0):
+		if reset not in ['instantaneous', 'definite', 'inverse']:
+			raise ValueError('reset must be instantaneous, definite or inverse')
+		self.elements = list(elements)
+		self.dt = dt
+		self.reset = reset
+		self.treset = np.broadcast_to(
+			np.asarray(treset, dtype=float), (len(self.elements),)
+			)
+		if reset == 'inverse':
+			self._resetstages = [_gradestage(element) for element in self.elements]
+			for stage in self._resetstages:
+				if getattr(stage.characteristic, 'tr', None) is None:
+					raise ValueError('The curve has no inverse reset characteristic')
+		self.state = np.zeros(len(self.elements))
+		self.tripped = np.zeros(len(self.elements), dtype=bool)
+		self.triptime = np.full(len(self.elements), np.inf)
+		self.dropout = np.zeros(len(self.elements), dtype=int)
+		self.samples = 0
+
+	def update(self, I):
+		"""Integrates a chunk of current samples, I has one row per sample and one
+		column per element, a one dimensional chunk is applied to every element.
+		The trip percentage (1.0 = 100%) at each sample of the chunk is returned.
+		"""
+		I = np.asarray(I, dtype=float)
+		if I.ndim == 1:
+			I = np.repeat(I[:, None], len(self.elements), axis=1)
+		n = I.shape[0]
+		rise = np.empty(I.shape)
+		for k, element in enumerate(self.elements):
+			if self.tripped[k]:
+				rise[:, k] = 0
+			else:
+				rise[:, k] = self.dt / _elementtime(element, I[:, k])
+		pickedup = rise > 0
+
+		# the number of samples each element has been below pickup, carried over
+		# from the last chunk
+		index = np.arange(n)[:, None]
+		last = np.maximum.accumulate(np.where(pickedup, index, -1), axis=0)
+		dropout = np.where(last < 0, index + 1 + self.dropout, index - last)
+		self.dropout = dropout[-1]
+
+		# a fall of 1 per sample resets completely as the state is below 100%
+		if self.reset == 'definite':
+			hold = np.ceil(self.treset / self.dt - 1e-9)
+			fall = np.where(dropout >= hold, 1.0, 0.0)
+		elif self.reset == 'inverse':
+			fall = np.empty(I.shape)
+			for k, stage in enumerate(self._resetstages):
+				M = np.minimum(I[:, k] / stage.pickup, 1)
+				tr = stage.tms * stage.characteristic.tr
+				fall[:, k] = np.minimum(self.dt * (1 - M**2) / tr, 1)
 		else:
-			pass
+			fall = np.ones(I.shape)
+		step = np.where(pickedup, rise, -fall)
 
+		# the state is floored at zero, x[n] = max(x[n-1] + step[n], 0) is solved
+		# with a running minimum of the cumulative sum
+		total = np.cumsum(step, axis=0)
+		floor = np.minimum(np.minimum.accumulate(total, axis=0), -self.state)
+		state = total - floor
 
-def plotcurve(relay):
-	fig = plt.figure()
-	fig.suptitle('No axes on this figure')  # Add a title so we know which it is
-	current = list(range(100,100000,10))
-	# t = lambda I : relay.getoptime(I)
-	times = []
-	for i in current:
-		times.append(relay.getoptime(I))
-	plt.loglog(current, times);
-	x1,x2,y1,y2 = plt.axis()
-	plt.axis((100,10000,0.001,10))
+		crossed = state >= 1
+		first = np.argmax(crossed, axis=0)
+		trips = crossed.any(axis=0) & ~self.tripped
+		latched = self.tripped | (trips & (np.arange(n)[:, None] >= first))
+		state = np.where(latched, 1.0, state)
+		self.triptime[trips] = (self.samples + first[trips] + 1) * self.dt
+		self.tripped |= trips
+		self.state = state[-1]
+		self.samples += n
+		return state
+
+	def run(self, record, chunksize=65536):
+		"""Integrates a whole record in chunks of samples, the record can be an
+		array (including a numpy memmap) or an iterable that yields chunks, so that
+		the whole record does not need to be held in memory. The trip time of each
+		element is returned, inf where the element did not trip.
+		"""
+		if hasattr(record, 'shape'):
+			for start in range(0, record.shape[0], chunksize):
+				self.update(record[start:start + chunksize])
+		else:
+			for chunk in record:
+				self.update(chunk)
+		return self.triptime
 
+
+def plotcurve(relay, tol=0.005):
+	"""Plots the time-current characteristic of a relay on log-log axes"""
+	current, time = relay.sample(tol=tol)
+	fig = plt.figure()
+	fig.suptitle(relay.relayname)
+	plt.loglog(current, time)
+	plt.xlabel('Current (A)')
+	plt.ylabel('Time (s)')
+	plt.grid(True, which='both')
 	plt.show()
-	
-	
 
-testrelay = Relay()
-testrelay.add_element(Idmt(200,0.2,'SI'))
-testrelay.add_element(Idmt(400,0.05,'VI'))
-testrelay.add_element(Deftime(20000, 0.02))
-testrelay.add_element(Deftime(22000, 0.01))
 
-current = list(range(100,100000,10))
-t = lambda I : testrelay.getoptime(I)
+def plotsheets(groups, directory='.', fmt='svg', processes=None, tol=0.005):
+	"""Renders a time-current characteristic sheet for each group of relays and
+	writes it to a file named after the group, a number is added to a name that
+	is repeated so that no sheet is overwritten. The sheets are drawn without a
+	display using the Agg backend and are rendered in parallel worker processes.
+		Inputs:
+				groups = list of Pltidmt objects, one sheet is drawn for each
+				directory = the directory the sheets are written to
+				fmt = the file format, svg, png or pdf
+				processes = number of worker processes, None uses the number of CPUs and
+					1 renders the sheets in this process
+				tol = relative time tolerance of the drawn curves, see Relay.sample
+		Output is a list of the files written
+	"""
+	jobs = []
+	used = set()
+	for n, group in enumerate(groups):
+		name = group.name or 'sheet{}'.format(n + 1)
+		name = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in name)
+		unique, count = name, 1
+		while unique.lower() in used:
+			count += 1
+			unique = '{}_{}'.format(name, count)
+		used.add(unique.lower())
+		jobs.append((group, os.path.join(directory, unique + '.' + fmt), tol))
+	if processes == 1:
+		return [_rendersheet(job) for job in jobs]
+	with ProcessPoolExecutor(max_workers=processes) as pool:
+		return list(pool.map(_rendersheet, jobs))
 
-times = []
-for i in current:
-	times.append(t(i))
 
-plt.loglog(current, times);
-x1,x2,y1,y2 = plt.axis()
-plt.axis((100,10000,0.001,10))
+def _rendersheet(job):
+	"""draws one sheet, this is called in the worker processes of plotsheets"""
+	group, filename, tol = job
+	fig = Figure(figsize=(8.27, 11.69))
+	FigureCanvasAgg(fig)
+	ax = fig.add_subplot()
+	Imin, Imax = _tccrange(group.relays)
+	for relay in group.relays:
+		current, time = relay.sample(Imin, getattr(relay, 'max', Imax), tol)
+		ax.loglog(current, time, label=relay.relayname)
+	ax.set_xlim(Imin, Imax)
+	ax.set_ylim(0.01, 1000)
+	ax.set_xlabel('Current (A)')
+	ax.set_ylabel('Time (s)')
+	ax.grid(True, which='both', linewidth=0.3)
+	ax.set_title(group.name)
+	if any(relay.relayname for relay in group.relays):
+		ax.legend()
+	fig.savefig(filename)
+	return filename
 
-plt.show()
 
+def _tccrange(relays):
+	"""returns the current range of a sheet, from half the lowest pickup to ten
+	times the highest breakpoint of the relays, the default range for a sheet
+	without relays or breakpoints"""
+	edges = np.concatenate(
+		[np.zeros(0)] + [relay.envelope.breakpoints for relay in relays]
+		)
+	if edges.size == 0:
+		return 1, 100000
+	return edges.min() / 2, edges.max() * 10
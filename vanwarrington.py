@@ -1,11 +1,19 @@
-def vanwarrington(Ifault, length=1):
+import numpy as np
+
+
+def vanwarrington(Ifault, length=1, decimals=2):
     """Calculates the resistance of an arc given a fault current and length
 Inputs: 
-    Ifault = Fault current in Amperes
+    Ifault = Fault current in Amperes, can be an array
     length = are length in meters
+    decimals = decimal places the resistance is rounded to, None for no rounding
 
 Output:
-    Resistance in ohms to two decimal places"""
+    Resistance in ohms, to two decimal places by default"""
     
-    Resistance = round(28710 * length / Ifault**1.4, 2)
+    Resistance = 28710 * length / np.asarray(Ifault, dtype=float)**1.4
+    if decimals is not None:
+        Resistance = np.round(Resistance, decimals)
+    if Resistance.ndim == 0:
+        return float(Resistance)
     return Resistance